@@ -0,0 +1,406 @@
+"""End-to-end benchmark: the bot's handlers against local stand-ins.
+
+Stand-ins:
+- a fake media API serving a synthetic catalog at /media and /media/<id>;
+- the throttled, range-capable file host from bench_download.py;
+- StubClient, a pyrogram Client look-alike that answers each Bot API call
+  after a simulated round trip. With --limiter, calls also go through the
+  bot's Telegram rate limiter, which then dominates the latencies.
+- with --redis, the Redis stand-in from fake_redis.py as the shared state
+  backend, so sessions, file ids, counters and download locks go over RESP.
+
+Workloads:
+- filter_media_by_query over the whole catalog;
+- a search storm, with one auto_filter call per user, all at once;
+- callback browsing: paging, opening a title and going back;
+- concurrent send_video_file downloads, with several users sharing each file;
+- catalog rebuilds, reporting how late a 1 ms ticker fires meanwhile.
+  Compare --search-workers 0 (index built on the event loop) with the pool.
+
+Each workload reports throughput, p50/p95/p99 latency and the tracemalloc
+peak. Latencies include tracemalloc's overhead; pass --no-memory to drop it.
+
+Usage: python benchmarks/bench_bot.py [--catalog N] [--users N] [--downloads N] [--files N] [--limiter] [--redis]
+       [--search-workers N]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+import fake_redis  # noqa: E402
+from bench_download import make_handler  # noqa: E402
+from bench_search import QUERIES, filter_media_by_query, make_catalog  # noqa: E402
+
+
+# Stand-in media API
+async def start_media_api(catalog: list, revision: list) -> web.AppRunner:
+    """Serve catalog; bumping revision[0] makes the next refresh download and rebuild it"""
+    by_id = {media["id"]: media for media in catalog}
+    body = json.dumps(catalog).encode()  # Encoded once, so serving it does not stall the loop being measured
+
+    async def list_media(request: web.Request) -> web.Response:
+        etag = f'"catalog-{len(catalog)}-{revision[0]}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+    async def get_media(request: web.Request) -> web.Response:
+        media = by_id.get(int(request.match_info["media_id"]))
+        if media is None:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response(media)
+
+    api = web.Application()
+    api.add_routes([web.get("/media", list_media), web.get("/media/{media_id}", get_media)])
+    runner = web.AppRunner(api, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    main.media_api.base_url = f"http://127.0.0.1:{port}"
+    return runner
+
+
+# Stand-in Telegram
+class StubUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.first_name = f"User {user_id}"
+        self.is_self = False
+
+
+class StubChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class StubDocument:
+    def __init__(self, file_id: str, file_size: int):
+        self.file_id = file_id
+        self.file_size = file_size
+
+
+class StubMember:
+    status = "member"
+
+
+class StubMessage:
+    def __init__(self, client: "StubClient", chat_id: int, message_id: int, text: str = None,
+                 from_user: StubUser = None, document: StubDocument = None):
+        self._client = client
+        self.id = message_id
+        self.chat = StubChat(chat_id)
+        self.from_user = from_user
+        self.text = text
+        self.caption = None
+        self.document = document
+        self.entities = None
+        self.reply_to_message = None
+
+    async def reply_text(self, text: str, **kwargs):
+        return await self._client.send_message(chat_id=self.chat.id, text=text, **kwargs)
+
+    async def reply_photo(self, photo, **kwargs):
+        return await self._client.send_photo(chat_id=self.chat.id, photo=photo, **kwargs)
+
+    async def edit_text(self, text: str, **kwargs):
+        return await self._client.edit_message_text(chat_id=self.chat.id, message_id=self.id, text=text, **kwargs)
+
+    async def delete(self):
+        return await self._client.delete_messages(self.chat.id, self.id)
+
+    async def react(self, emoji: str):
+        return await self._client.send_reaction(self.chat.id, self.id, emoji)
+
+
+class StubCallbackQuery:
+    def __init__(self, client: "StubClient", user_id: int, message: StubMessage, data: str):
+        self._client = client
+        self.from_user = StubUser(user_id)
+        self.message = message
+        self.data = data
+
+    async def answer(self, text: str = None, show_alert: bool = False):
+        await self._client.round_trip(None)
+
+    async def edit_message_text(self, text: str, reply_markup=None, **kwargs):
+        return await self._client.edit_message_text(
+            chat_id=self.message.chat.id, message_id=self.message.id, text=text, reply_markup=reply_markup
+        )
+
+    async def edit_message_reply_markup(self, reply_markup=None):
+        await self._client.round_trip(self.message.chat.id)
+        return self.message
+
+
+class StubClient:
+    """Answers the Bot API calls the bot makes after `latency` seconds"""
+
+    def __init__(self, latency: float, upload_rate: int, limited: bool):
+        self.latency = latency
+        self.upload_rate = upload_rate
+        self.limited = limited
+        self.calls = 0
+        self.texts = {}  # (chat_id, message_id) -> latest text, so callbacks can read footers
+        self.last_message = {}  # chat_id -> id of the newest message
+        self._next_id = 0
+
+    async def _sleep(self):
+        await asyncio.sleep(self.latency)
+
+    async def round_trip(self, chat_id):
+        self.calls += 1
+        if self.limited:
+            await main.telegram_limiter.call(chat_id, self._sleep)
+        else:
+            await self._sleep()
+
+    def _message(self, chat_id: int, text: str = None, document: StubDocument = None) -> StubMessage:
+        self._next_id += 1
+        self.texts[(chat_id, self._next_id)] = text
+        self.last_message[chat_id] = self._next_id
+        return StubMessage(self, chat_id, self._next_id, text, document=document)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        await self.round_trip(chat_id)
+        return self._message(chat_id, text)
+
+    async def send_photo(self, chat_id: int, photo, caption: str = None, **kwargs):
+        await self.round_trip(chat_id)
+        return self._message(chat_id, caption)
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs):
+        await self.round_trip(chat_id)
+        self.texts[(chat_id, message_id)] = text
+        return StubMessage(self, chat_id, message_id, text)
+
+    async def delete_messages(self, chat_id: int, message_ids, **kwargs):
+        await self.round_trip(chat_id)
+        return True
+
+    async def send_reaction(self, chat_id: int, message_id: int, emoji: str = None, **kwargs):
+        await self.round_trip(chat_id)
+        return True
+
+    async def get_chat_member(self, chat_id, user_id: int):
+        await self.round_trip(None)
+        return StubMember()
+
+    async def send_cached_media(self, chat_id: int, file_id: str, **kwargs):
+        await self.round_trip(chat_id)
+        return self._message(chat_id, document=StubDocument(file_id, 0))
+
+    async def send_document(self, chat_id: int, document, **kwargs):
+        await self.round_trip(chat_id)
+        if isinstance(document, main.StreamingUpload):
+            size = 0
+            while True:
+                part = await document.read(main.FilmziClient.UPLOAD_PART_SIZE)
+                size += len(part)
+                await asyncio.sleep(len(part) / self.upload_rate)
+                if len(part) < main.FilmziClient.UPLOAD_PART_SIZE:
+                    break
+        else:
+            size = os.path.getsize(document)
+            await asyncio.sleep(size / self.upload_rate)
+        return self._message(chat_id, document=StubDocument(f"file-{self._next_id}", size))
+
+
+# Measurement
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(name: str, latencies: list, elapsed: float, memory: bool):
+    peak = f"{tracemalloc.get_traced_memory()[1] / 1024 / 1024:8.1f} MiB" if memory else "       n/a"
+    print(
+        f"{name:<26} {len(latencies):>6} ops {len(latencies) / elapsed:9.1f} ops/s | "
+        f"p50 {percentile(latencies, 50) * 1000:8.2f} ms  p95 {percentile(latencies, 95) * 1000:8.2f} ms  "
+        f"p99 {percentile(latencies, 99) * 1000:8.2f} ms | peak {peak}"
+    )
+
+
+async def timed(coro) -> float:
+    began = time.perf_counter()
+    await coro
+    return time.perf_counter() - began
+
+
+async def run_concurrently(name: str, coros: list, memory: bool):
+    if memory:
+        tracemalloc.reset_peak()
+    began = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(coro) for coro in coros))
+    report(name, latencies, time.perf_counter() - began, memory)
+
+
+# Workloads
+def bench_filter(catalog: list, memory: bool):
+    if memory:
+        tracemalloc.reset_peak()
+    latencies = []
+    began = time.perf_counter()
+    for _ in range(max(1, 2000 // len(QUERIES))):
+        for query in QUERIES:
+            started = time.perf_counter()
+            filter_media_by_query(catalog, query)
+            latencies.append(time.perf_counter() - started)
+        if time.perf_counter() - began > 10:
+            break
+    report("filter_media_by_query", latencies, time.perf_counter() - began, memory)
+
+
+async def bench_search_storm(client: StubClient, users: list, memory: bool):
+    rng = random.Random(1)
+    messages = [
+        StubMessage(client, user_id, 0, rng.choice(QUERIES + ["spider", "night", "kingdom"]), StubUser(user_id))
+        for user_id in users
+    ]
+    await run_concurrently("search storm (auto_filter)", [main.auto_filter(client, m) for m in messages], memory)
+
+
+async def browse(client: StubClient, user_id: int) -> list:
+    """One user's search followed by a round of callbacks; returns the callback latencies"""
+    await main.auto_filter(client, StubMessage(client, user_id, 0, "the", StubUser(user_id)))
+    latencies = []
+    for data in ("result_page_1", "result_page_2", "select", "back_to_search", "result_page_0"):
+        message_id = client.last_message[user_id]
+        message = StubMessage(client, user_id, message_id, client.texts.get((user_id, message_id)))
+        if data == "select":
+            session = await main.search_sessions.fetch(user_id)
+            data = f"select_{session.ids[session.page]}" if session else "noop"
+        latencies.append(await timed(main.handle_callback_query(client, StubCallbackQuery(client, user_id, message, data))))
+    return latencies
+
+
+async def bench_callbacks(client: StubClient, users: list, memory: bool):
+    if memory:
+        tracemalloc.reset_peak()
+    began = time.perf_counter()
+    per_user = await asyncio.gather(*(browse(client, user_id) for user_id in users))
+    latencies = [latency for user_latencies in per_user for latency in user_latencies]
+    report("callback browsing", latencies, time.perf_counter() - began, memory)
+
+
+async def bench_rebuilds(revision: list, rebuilds: int):
+    """Catalog refreshes that change the catalog, with a 1 ms ticker measuring event loop lag meanwhile"""
+    lags = []
+
+    async def tick():
+        while True:
+            expected = time.perf_counter() + 0.001
+            await asyncio.sleep(0.001)
+            lags.append(max(time.perf_counter() - expected, 0.0))
+
+    durations = []
+    for _ in range(rebuilds):
+        revision[0] += 1
+        ticker = asyncio.create_task(tick())
+        durations.append(await timed(main.catalog_cache.refresh()))
+        await asyncio.sleep(0.005)  # Let the ticker see a stall at the very end of the refresh
+        ticker.cancel()
+    mode = f"{main.search_pool.workers} search workers" if main.search_pool.enabled else "in-process index"
+    print(
+        f"{'catalog rebuild':<26} {rebuilds:>6} ops ({mode}) | avg {sum(durations) / len(durations) * 1000:8.1f} ms | "
+        f"loop lag p50 {percentile(lags, 50) * 1000:.2f} ms  p99 {percentile(lags, 99) * 1000:.2f} ms  "
+        f"max {max(lags) * 1000:.2f} ms"
+    )
+
+
+async def bench_downloads(client: StubClient, host: str, catalog: list, downloads: int, files: int, memory: bool):
+    rng = random.Random(2)
+    jobs = []
+    for user_index in range(downloads):
+        media = catalog[user_index % files]
+        url = f"{host}/{media['id']}/720p.mp4"
+        jobs.append(main.send_video_file(client, 900000 + user_index, url, media, "720p"))
+    rng.shuffle(jobs)
+    await run_concurrently(f"send_video_file ({files} files)", jobs, memory)
+
+
+async def run(args):
+    catalog = make_catalog(args.catalog)
+    revision = [0]
+    media_runner = await start_media_api(catalog, revision)
+    if args.search_workers is not None:
+        main.search_pool = main.SearchPool(args.search_workers)
+
+    payload = os.urandom(args.file_size * 1024 * 1024)
+    file_host = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(payload, args.rate * 1024))
+    file_host.daemon_threads = True
+    threading.Thread(target=file_host.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{file_host.server_port}"
+
+    if args.redis:
+        redis_server = await fake_redis.start()
+        port = redis_server.sockets[0].getsockname()[1]
+        main.state_backend = main.RedisBackend(f"redis://127.0.0.1:{port}/0", main.REDIS_POOL_SIZE, main.STATE_PREFIX)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        main.TEMP_DIR = tmp
+        main.CATALOG_SNAPSHOT = os.path.join(tmp, "catalog.json")
+        main.video_cache = main.VideoCache(tmp, main.VIDEO_CACHE_BYTES, 0, os.path.join(tmp, "cache_index.json"))
+        main.file_id_cache = main.FileIdCache(":memory:")
+        main.file_id_cache.load()
+        await main.catalog_cache.refresh()
+
+        client = StubClient(args.latency / 1000, args.upload_rate * 1024 * 1024, args.limiter)
+        memory = not args.no_memory
+        if memory:
+            tracemalloc.start()
+        print(f"catalog {args.catalog} titles, {args.users} users, Bot API round trip {args.latency} ms")
+        bench_filter(catalog, memory)
+        await bench_search_storm(client, list(range(1, args.users + 1)), memory)
+        await bench_callbacks(client, list(range(100001, 100001 + args.users)), memory)
+        await bench_downloads(client, host, catalog, args.downloads, args.files, memory)
+        await bench_rebuilds(revision, args.rebuilds)
+        print(f"{client.calls} Bot API calls" + (f", limiter: {main.telegram_limiter.stats()}" if args.limiter else ""))
+        main.file_id_cache.close()
+
+    if args.redis:
+        await main.stats_store.flush()
+        print(f"shared state: {await main.shared_activity.total_users()} users, "
+              f"sessions {main.search_sessions.stats()['shared_hits']} and file ids "
+              f"{main.file_id_cache.shared_hits} read back from it")
+        await main.state_backend.close()
+        redis_server.close()
+    file_host.shutdown()
+    await media_runner.cleanup()
+    await main.media_api.close()
+    main.search_pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--catalog", type=int, default=10000, help="titles in the fake catalog")
+    parser.add_argument("--users", type=int, default=200, help="concurrent users for search and browsing")
+    parser.add_argument("--downloads", type=int, default=12, help="concurrent send_video_file calls")
+    parser.add_argument("--files", type=int, default=4, help="distinct files among the downloads")
+    parser.add_argument("--file-size", type=int, default=4, help="MiB per file")
+    parser.add_argument("--rate", type=int, default=8192, help="file host cap per connection, KiB/s")
+    parser.add_argument("--upload-rate", type=int, default=20, help="simulated upload speed, MiB/s")
+    parser.add_argument("--latency", type=float, default=20, help="simulated Bot API round trip, ms")
+    parser.add_argument("--limiter", action="store_true", help="admit calls through the Telegram rate limiter")
+    parser.add_argument("--redis", action="store_true", help="share state through the local Redis stand-in")
+    parser.add_argument("--search-workers", type=int, help="search worker processes, 0 for the in-process index "
+                        "(default: SEARCH_WORKERS)")
+    parser.add_argument("--rebuilds", type=int, default=3, help="catalog rebuilds to time")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc")
+    # Slow-request traces would drown the report
+    logging.getLogger("main").setLevel(logging.ERROR)
+    asyncio.run(run(parser.parse_args()))
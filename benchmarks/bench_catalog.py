@@ -0,0 +1,103 @@
+"""Memory benchmark: the catalog as decoded JSON dicts vs. the columnar Catalog.
+
+Titles carry what the real API sends: a description, poster and IMDb ids, and
+either video links (movies) or seasons of episodes with their own links (tv).
+"dicts" is what the bot used to keep: json.loads() of the catalog plus an
+id -> dict map. "Catalog" keeps the search fields in arrays and the rest as
+compact JSON, of which "cold" is the part.
+
+Usage: python benchmarks/bench_catalog.py [sizes...]
+"""
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import Catalog  # noqa: E402
+from bench_search import WORDS, make_catalog  # noqa: E402
+
+
+def video_links(rng: random.Random, slug: str) -> dict:
+    qualities = rng.sample(["1080p", "720p", "480p"], rng.randint(1, 3))
+    return {quality: f"https://files.example.com/{slug}/{quality}.mp4" for quality in qualities}
+
+
+def make_full_catalog(size: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    catalog = make_catalog(size)
+    for media in catalog:
+        slug = f"{media['id']}-{media['title'].lower().replace(' ', '-')}"
+        media["description"] = " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 60))).capitalize() + "."
+        media["language"] = rng.choice(["en", "hi", "ml", "ta", "ko"])
+        media["duration"] = f"{rng.randint(80, 180)} min"
+        media["poster_url"] = f"https://images.example.com/posters/{slug}.jpg"
+        media["imdb_id"] = f"tt{rng.randint(1000000, 9999999)}"
+        if media["type"] == "movie":
+            media["video_links"] = video_links(rng, slug)
+        else:
+            media["seasons"] = {
+                f"season_{season}": {
+                    "episodes": [
+                        {
+                            "episode_number": episode,
+                            "title": f"Episode {episode}",
+                            "video_links": video_links(rng, f"{slug}/s{season}e{episode}"),
+                        }
+                        for episode in range(1, rng.randint(6, 12))
+                    ]
+                }
+                for season in range(1, rng.randint(2, 4))
+            }
+    return catalog
+
+
+def measure(build) -> tuple:
+    """(result, bytes it holds, seconds to build it); timed on a separate run without tracemalloc"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    started = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - started
+    return result, current, elapsed
+
+
+def run(size: int):
+    body = json.dumps(make_full_catalog(size)).encode()
+
+    def decode_dicts():
+        media = json.loads(body)
+        return media, {item["id"]: item for item in media}
+
+    _, dicts_bytes, dicts_time = measure(decode_dicts)
+    catalog, catalog_bytes, catalog_time = measure(lambda: asyncio.run(Catalog.decode(body)))
+    cold = len(catalog._blob) + catalog._offsets.itemsize * len(catalog._offsets)
+
+    started = time.perf_counter()
+    for media_id in catalog.ids[:1000]:
+        catalog.details(media_id)
+    details = (time.perf_counter() - started) / min(len(catalog), 1000)
+
+    per_10k = 10000 / size / 1024 / 1024
+    print(
+        f"{size:>7} titles ({len(body) / size / 1024:.1f} KiB JSON each) | "
+        f"dicts {dicts_bytes * per_10k:7.1f} MiB/10k ({dicts_time * 1000:6.0f} ms) | "
+        f"Catalog {catalog_bytes * per_10k:6.1f} MiB/10k ({catalog_time * 1000:6.0f} ms), "
+        f"hot {(catalog_bytes - cold) * per_10k:5.1f} + cold {cold * per_10k:5.1f} | "
+        f"{dicts_bytes / catalog_bytes:4.1f}x smaller | details() {details * 1e6:5.1f} us"
+    )
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 50000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,102 @@
+"""Benchmark: single-stream vs. segmented downloads from a throttled local host.
+
+The stand-in host honours Range requests and caps every connection at
+--rate bytes/s, the way PixelDrain or Google Drive throttle one connection.
+
+Usage: python benchmarks/bench_download.py [--size MiB] [--rate KiB/s]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def make_handler(payload: bytes, rate: int):
+    class RangeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            start, end, status = 0, len(payload) - 1, 200
+            requested = self.headers.get("Range")
+            if requested and requested.startswith("bytes="):
+                first, _, last = requested[6:].partition("-")
+                start = int(first)
+                end = int(last) if last else end
+                status = 206
+            body = payload[start:end + 1]
+            self.send_response(status)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", '"bench"')
+            self.send_header("Content-Length", str(len(body)))
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+            self.end_headers()
+            # Throttle this connection to `rate` bytes per second
+            step = max(rate // 20, 1024)
+            for offset in range(0, len(body), step):
+                began = time.monotonic()
+                try:
+                    self.wfile.write(body[offset:offset + step])
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                time.sleep(max(0.0, step / rate - (time.monotonic() - began)))
+
+        def log_message(self, *args):
+            pass
+
+    return RangeHandler
+
+
+def sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+async def run(size: int, rate: int):
+    payload = os.urandom(size)
+    expected = hashlib.sha256(payload).hexdigest()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(payload, rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/video.mp4"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        single_path = os.path.join(tmp, "single.mp4")
+        began = time.perf_counter()
+        ok = await main.download_file_with_progress(url, single_path)
+        single = time.perf_counter() - began
+        assert ok and sha256(single_path) == expected
+
+        segmented_path = os.path.join(tmp, "segmented.mp4")
+        source = await main.probe_source(url)
+        download = main.SegmentedDownload(url, segmented_path, source["size"], source["validator"])
+        began = time.perf_counter()
+        ok = await download.run()
+        segmented = time.perf_counter() - began
+        assert ok and sha256(segmented_path) == expected
+
+    server.shutdown()
+    mib = size / 1024 / 1024
+    print(f"file {mib:.0f} MiB, {rate // 1024} KiB/s per connection")
+    print(f"  single stream : {single:6.2f} s  {mib / single:6.2f} MiB/s")
+    print(f"  segmented     : {segmented:6.2f} s  {mib / segmented:6.2f} MiB/s "
+          f"({download.connections} connections, {single / segmented:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=48, help="file size in MiB")
+    parser.add_argument("--rate", type=int, default=4096, help="per-connection cap in KiB/s")
+    args = parser.parse_args()
+    main.PARALLEL_PIECE_SIZE = 4 * 1024 * 1024
+    asyncio.run(run(args.size * 1024 * 1024, args.rate * 1024))
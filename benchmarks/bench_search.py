@@ -0,0 +1,137 @@
+"""Micro-benchmark: SearchIndex vs. the linear filter_media_by_query scan.
+
+"indexed" is the unranked SearchIndex.search() used for the parity check;
+"ranked" adds scoring and the typo-tolerant fallback (SearchIndex.ranked_search()).
+
+Usage: python benchmarks/bench_search.py [sizes...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import Catalog, SearchIndex  # noqa: E402
+
+WORDS = [
+    "spider", "man", "no", "way", "home", "the", "matrix", "inception", "dark", "knight",
+    "avengers", "endgame", "breaking", "bad", "stranger", "things", "game", "of", "thrones",
+    "office", "friends", "iron", "captain", "america", "wonder", "woman", "star", "wars",
+    "return", "rise", "fall", "night", "day", "city", "lost", "kingdom", "shadow", "fire",
+    "ice", "blood", "moon", "sun", "river", "storm", "legend", "empire", "ghost", "hunter",
+]
+QUERIES = [
+    "spider man", "matrix", "the", "dark knight", "ar", "kingdom of fire", "xyzzy",
+    "avengrs", "night city", "legend 3", "ghost hunter", "empire", "no way home",
+]
+
+
+def make_catalog(size: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    catalog = []
+    for media_id in range(1, size + 1):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+        if rng.random() < 0.3:
+            title += f" {rng.randint(2, 9)}"
+        media = {
+            "id": media_id,
+            "title": title.title(),
+            "type": rng.choice(["movie", "tv"]),
+            "release_date": f"{rng.randint(1980, 2025)}-01-01",
+            "rating": round(rng.uniform(3, 9.5), 1),
+        }
+        if rng.random() < 0.5:
+            media["keywords"] = [rng.choice(WORDS) for _ in range(rng.randint(1, 3))]
+        if rng.random() < 0.2:
+            media["alternative_titles"] = [" ".join(rng.choice(WORDS) for _ in range(2))]
+        catalog.append(media)
+    return catalog
+
+
+def filter_media_by_query(all_media: list, query: str) -> list:
+    """The bot's original linear search, kept as the reference SearchIndex must match"""
+    query = query.lower().strip()
+    if not query:
+        return all_media
+    
+    filtered = []
+    query_words = query.split()
+    
+    for media in all_media:
+        title = media.get('title', '').lower()
+        
+        # Exact match
+        if query in title:
+            filtered.append(media)
+            continue
+        
+        # Word-by-word match
+        title_words = title.split()
+        if all(any(query_word in title_word for title_word in title_words) for query_word in query_words):
+            filtered.append(media)
+            continue
+        
+        # Check if all query words are present
+        if all(word in title for word in query_words):
+            filtered.append(media)
+            continue
+        
+        # Partial match for single words
+        if len(query_words) == 1 and query in title:
+            filtered.append(media)
+            continue
+        
+        # Check keywords
+        if 'keywords' in media and media['keywords']:
+            if any(query in kw.lower() for kw in media['keywords']):
+                filtered.append(media)
+                continue
+        
+        # Check alternative titles
+        if 'alternative_titles' in media and media['alternative_titles']:
+            for alt_title in media['alternative_titles']:
+                if query in alt_title.lower():
+                    filtered.append(media)
+                    break
+    
+    return filtered
+
+
+def timed(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(size: int):
+    catalog = make_catalog(size)
+    compact = Catalog.from_media(catalog, details=False)
+    build = timed(lambda: SearchIndex(compact), 1)
+    index = SearchIndex(compact)
+    repeat = max(1, 20000 // size)
+
+    linear_total = indexed_total = ranked_total = 0.0
+    for query in QUERIES:
+        expected = filter_media_by_query(catalog, query)
+        actual = index.search(query)
+        assert list(actual) == [m["id"] for m in expected], query
+        linear_total += timed(lambda: filter_media_by_query(catalog, query), repeat)
+        indexed_total += timed(lambda: index.search(query), repeat)
+        ranked_total += timed(lambda: index.ranked_search(query), repeat)
+
+    count = len(QUERIES)
+    print(
+        f"{size:>7} titles | build {build * 1000:8.1f} ms | "
+        f"linear {linear_total / count * 1000:8.3f} ms/query | "
+        f"indexed {indexed_total / count * 1000:8.3f} ms/query | "
+        f"ranked {ranked_total / count * 1000:8.3f} ms/query | "
+        f"speedup {linear_total / indexed_total:6.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,111 @@
+"""A local stand-in for Redis: speaks enough RESP for main.RedisBackend.
+
+Commands are answered by main.MemoryBackend, so expiry and type errors
+behave the same as with STATE_BACKEND=memory. It is a test double only:
+single process, no persistence, no AUTH/SELECT checks.
+
+Usage: python benchmarks/fake_redis.py [--port N]
+then run workers with STATE_BACKEND=redis REDIS_URL=redis://127.0.0.1:N/0
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, bool):
+        return b"+OK\r\n" if reply else b"$-1\r\n"
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, Exception):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, (list, tuple)):
+        return f"*{len(reply)}\r\n".encode() + b"".join(encode(item) for item in reply)
+    data = str(reply).encode()
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+
+async def read_command(reader: asyncio.StreamReader) -> list:
+    header = await reader.readline()
+    if not header:
+        return []
+    if not header.startswith(b"*"):
+        return header.decode().split()  # Inline command, e.g. from telnet
+    args = []
+    for _ in range(int(header[1:])):
+        length = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(length + 2))[:-2].decode())
+    return args
+
+
+async def dispatch(store: main.MemoryBackend, args: list):
+    command, args = args[0].upper(), args[1:]
+    if command == "PING":
+        return "PONG"
+    if command in ("AUTH", "SELECT"):
+        return True
+    if command == "GET":
+        return await store.get(args[0])
+    if command == "SET":
+        options = [arg.upper() for arg in args[2:]]
+        ttl = int(args[2 + options.index("EX") + 1]) if "EX" in options else None
+        return await store.set(args[0], args[1], ttl=ttl, nx="NX" in options)
+    if command == "DEL":
+        present = sum(1 for key in args if store._live(key) is not None)
+        await store.delete(*args)
+        return present
+    if command == "EXPIRE":
+        present = store._live(args[0]) is not None
+        await store.expire(args[0], int(args[1]))
+        return int(present)
+    if command == "HINCRBY":
+        return await store.hincrby(args[0], args[1], int(args[2]))
+    if command == "HGETALL":
+        return [item for pair in (await store.hgetall(args[0])).items() for item in pair]
+    if command == "SADD":
+        return await store.sadd(args[0], *args[1:])
+    if command == "SCARD":
+        return await store.scard(args[0])
+    return main.StateBackendError(f"ERR unknown command '{command}'")
+
+
+async def start(port: int = 0) -> asyncio.AbstractServer:
+    store = main.MemoryBackend()
+
+    async def serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while args := await read_command(reader):
+                try:
+                    reply = await dispatch(store, args)
+                except main.StateBackendError as e:
+                    reply = e
+                except (IndexError, ValueError) as e:
+                    reply = main.StateBackendError(f"ERR {e}")
+                writer.write(encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(serve, "127.0.0.1", port)
+
+
+async def run(port: int):
+    server = await start(port)
+    print(f"Listening on redis://127.0.0.1:{server.sockets[0].getsockname()[1]}/0")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6379)
+    asyncio.run(run(parser.parse_args().port))
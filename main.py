@@ -1,22 +1,44 @@
 import os
 import re
 import asyncio
+import contextvars
+import contextlib
+import functools
 import threading
 import json
 import logging
-import requests
+import time
+import random
+import math
+import zlib
+import sqlite3
+import shutil
+import heapq
+import sys
+import socket
+import urllib.parse
+import multiprocessing
 import aiohttp
 import aiofiles
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from hashlib import md5
 from datetime import datetime, timedelta
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from pyrogram import Client, filters
+from aiohttp import web
+from bisect import bisect_left, bisect_right
+from pyrogram import Client, filters, idle, raw
+from pyrogram.session import Session
 from pyrogram.types import (
     InlineKeyboardMarkup, 
     InlineKeyboardButton, 
     Message, 
     CallbackQuery,
+    ChatMemberUpdated,
 )
-from pyrogram.errors import UserNotParticipant, ChatAdminRequired
+from pyrogram.errors import UserNotParticipant, ChatAdminRequired, FloodWait, MessageNotModified
 from typing import Dict, List, Union
 
 # Configure logging
@@ -32,6 +54,10 @@ API_HASH = os.getenv('API_HASH', "f608d185d836e0405775833c6888922f")
 BOT_TOKEN = os.getenv('BOT_TOKEN', "7613692613:AAGkBg5_PDJkNSVf_a0uU0nYNS09GceDltw")
 BASE_URL = os.getenv('BASE_URL', "https://v0-flask-movie-database-nine.vercel.app")
 PORT = int(os.getenv('PORT', 8000))
+HEALTH_MAX_LOOP_LAG = float(os.getenv('HEALTH_MAX_LOOP_LAG', 5))  # Seconds of event loop delay before /health fails
+HEALTH_CATALOG_MAX_AGE = int(os.getenv('HEALTH_CATALOG_MAX_AGE', 1800))  # Seconds since the last catalog refresh
+HEALTH_STARTUP_GRACE = int(os.getenv('HEALTH_STARTUP_GRACE', 120))  # Seconds allowed for the first catalog load
+LOOP_MONITOR_INTERVAL = float(os.getenv('LOOP_MONITOR_INTERVAL', 0.1))  # Seconds between event loop heartbeats
 ADMIN_ID = int(os.getenv('ADMIN_ID', 0))  # Your Telegram user ID
 
 # Movie update group
@@ -40,70 +66,1195 @@ MOVIE_GROUP_LINK = "https://t.me/filmzi2"
 
 # API configuration
 MEDIA_ENDPOINT = "/media"
-STATS_FILE = "user_stats.json"
+STATS_FILE = "user_stats.json"  # Legacy JSON stats, migrated into STATS_DB on first start
+STATS_DB = os.getenv('STATS_DB', "user_stats.db")
+STATS_FLUSH_INTERVAL = int(os.getenv('STATS_FLUSH_INTERVAL', 10))  # Seconds between batched writes
+STATS_HISTORY_DAYS = int(os.getenv('STATS_HISTORY_DAYS', 30))  # Days of activity buckets to keep
+FILE_ID_DB = os.getenv('FILE_ID_DB', "file_ids.db")  # Telegram file_id of every uploaded video
+DELETIONS_DB = os.getenv('DELETIONS_DB', "deletions.db")  # Messages waiting to be auto-deleted
+DELETION_BATCH_WINDOW = int(os.getenv('DELETION_BATCH_WINDOW', 5))  # Seconds early a deletion may run to share a batch
+AUTO_DELETE_DELAY = int(os.getenv('AUTO_DELETE_DELAY', 15 * 60))  # Seconds a delivered file stays in the chat
+CATALOG_TTL = int(os.getenv('CATALOG_TTL', 300))  # Seconds between catalog refreshes
+CATALOG_SNAPSHOT = os.getenv('CATALOG_SNAPSHOT', "catalog.json")  # Raw catalog the search workers load
+CATALOG_DECODE_SLICE = float(os.getenv('CATALOG_DECODE_SLICE', 0.005))  # Seconds of decoding between event loop yields
+CATALOG_COMPRESS_LEVEL = int(os.getenv('CATALOG_COMPRESS_LEVEL', 1))  # zlib level for cold catalog fields; 0 = plain JSON
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', 1))  # Processes indexing and searching the catalog; 0 = in-process
+SEARCH_WORKER_NICE = int(os.getenv('SEARCH_WORKER_NICE', 5))  # Lower worker priority so the bot keeps its CPU share
+API_CONNECT_TIMEOUT = float(os.getenv('API_CONNECT_TIMEOUT', 5))
+API_READ_TIMEOUT = float(os.getenv('API_READ_TIMEOUT', 15))
+API_MAX_RETRIES = int(os.getenv('API_MAX_RETRIES', 3))
+API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', 50))
+API_POOL_PER_HOST = int(os.getenv('API_POOL_PER_HOST', 20))
+MEDIA_CACHE_SIZE = int(os.getenv('MEDIA_CACHE_SIZE', 2000))
+MEDIA_CACHE_TTL = int(os.getenv('MEDIA_CACHE_TTL', 600))
+MEDIA_FROM_CATALOG = os.getenv('MEDIA_FROM_CATALOG', '1') == '1'  # Catalog entries carry full details
+SESSION_TTL = int(os.getenv('SESSION_TTL', 3600))  # Seconds a search result list stays pageable
+SESSION_MAX_COUNT = int(os.getenv('SESSION_MAX_COUNT', 50000))
+SESSION_MAX_BYTES = int(os.getenv('SESSION_MAX_BYTES', 32 * 1024 * 1024))  # Approximate memory cap for all sessions
+SESSION_SHARED_IDS = int(os.getenv('SESSION_SHARED_IDS', 500))  # Result ids written to shared state per session
+
+# Membership cache configuration
+MEMBERSHIP_TTL = int(os.getenv('MEMBERSHIP_TTL', 3600))  # Seconds to trust a positive check
+MEMBERSHIP_NEGATIVE_TTL = int(os.getenv('MEMBERSHIP_NEGATIVE_TTL', 60))  # Seconds to trust a negative check
+MEMBERSHIP_CACHE_SIZE = int(os.getenv('MEMBERSHIP_CACHE_SIZE', 100000))
 
 # File storage configuration
 TEMP_DIR = "/tmp/filmzi_downloads"
 os.makedirs(TEMP_DIR, exist_ok=True)
+VIDEO_CACHE_BYTES = int(os.getenv('VIDEO_CACHE_BYTES', 10 * 1024 ** 3))  # Downloaded videos kept for re-sends
+VIDEO_CACHE_MIN_FREE = int(os.getenv('VIDEO_CACHE_MIN_FREE', 2 * 1024 ** 3))  # Evict when free disk drops below
+VIDEO_CACHE_SWEEP_INTERVAL = int(os.getenv('VIDEO_CACHE_SWEEP_INTERVAL', 300))
+VIDEO_CACHE_INDEX = os.path.join(TEMP_DIR, "cache_index.json")
+STREAM_UPLOADS = os.getenv('STREAM_UPLOADS', '1') == '1'  # Pipe downloads straight into uploads
+STREAM_BUFFER_SIZE = int(os.getenv('STREAM_BUFFER_SIZE', 8 * 1024 * 1024))  # Bytes held between the two
+SOURCE_READ_TIMEOUT = float(os.getenv('SOURCE_READ_TIMEOUT', 60))  # Longest silence from a file host mid-transfer
+PARALLEL_DOWNLOADS = os.getenv('PARALLEL_DOWNLOADS', '1') == '1'  # Ranged multi-connection downloads
+PARALLEL_MIN_SIZE = int(os.getenv('PARALLEL_MIN_SIZE', 32 * 1024 * 1024))  # Smaller files stream instead
+PARALLEL_PIECE_SIZE = int(os.getenv('PARALLEL_PIECE_SIZE', 8 * 1024 * 1024))
+PARALLEL_MIN_CONNECTIONS = int(os.getenv('PARALLEL_MIN_CONNECTIONS', 2))
+PARALLEL_MAX_CONNECTIONS = int(os.getenv('PARALLEL_MAX_CONNECTIONS', 8))
+PARALLEL_PIECE_RETRIES = int(os.getenv('PARALLEL_PIECE_RETRIES', 3))
+DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', 3))  # Resume attempts after a dropped connection
+RESUME_MAX_AGE = int(os.getenv('RESUME_MAX_AGE', 6 * 3600))  # Older partial downloads are discarded
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 5))  # Seconds between status message edits
+PROGRESS_WINDOW = float(os.getenv('PROGRESS_WINDOW', 10))  # Seconds of history behind speed and ETA
+
+# Telegram rate limits
+TG_GLOBAL_RATE = float(os.getenv('TG_GLOBAL_RATE', 25))  # Calls per second across all chats
+TG_GLOBAL_BURST = int(os.getenv('TG_GLOBAL_BURST', 30))
+TG_CHAT_RATE = float(os.getenv('TG_CHAT_RATE', 1))  # Calls per second to one private chat
+TG_CHAT_BURST = int(os.getenv('TG_CHAT_BURST', 3))
+TG_GROUP_RATE = float(os.getenv('TG_GROUP_RATE', 20 / 60))  # Calls per second to one group
+TG_GROUP_BURST = int(os.getenv('TG_GROUP_BURST', 5))
+TG_CHAT_BUCKETS = int(os.getenv('TG_CHAT_BUCKETS', 10000))  # Per-chat buckets kept in memory
+TG_MAX_RETRY_WAIT = int(os.getenv('TG_MAX_RETRY_WAIT', 30))  # Longer FloodWaits are not retried
+
+# Download scheduling
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', 3))
+MAX_DOWNLOADS_PER_USER = int(os.getenv('MAX_DOWNLOADS_PER_USER', 1))  # Running at once
+MAX_QUEUED_PER_USER = int(os.getenv('MAX_QUEUED_PER_USER', 3))  # Waiting at once
+PREMIUM_USERS = {int(uid) for uid in os.getenv('PREMIUM_USERS', '').split(',') if uid.strip()}
+
+# Shared state (set STATE_BACKEND=redis to run several workers side by side)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')  # memory | redis
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_POOL_SIZE = int(os.getenv('REDIS_POOL_SIZE', 10))
+STATE_PREFIX = os.getenv('STATE_PREFIX', 'filmzi:')  # Namespace for every shared key
+WORKER_ID = os.getenv('WORKER_ID', f"{socket.gethostname()}:{os.getpid()}")
+DOWNLOAD_LOCK_TTL = int(os.getenv('DOWNLOAD_LOCK_TTL', 120))  # Lease length; renewed while the download runs
+TRANSFER_RESULT_TTL = int(os.getenv('TRANSFER_RESULT_TTL', 600))  # How long waiters on other workers can pick it up
+
+# Tracing and profiling
+TRACING = os.getenv('TRACING', '1') == '1'  # Per-handler span timings
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 3))  # Log the span breakdown of slower handlers
+SLOW_TRANSFER_SECONDS = float(os.getenv('SLOW_TRANSFER_SECONDS', 1800))  # Same for a download + upload
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.01))  # Seconds between profiler stack samples
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 600))  # The profiler stops itself after this long
+
+# Tracing
+class Histogram:
+    """Cumulative histogram in the Prometheus exposition format"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str = "") -> List[str]:
+        prefix = f"{labels}," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+    def render(self, name: str, help_text: str) -> List[str]:
+        return [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"] + self.samples(name)
+
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+span_latency = {}     # span name -> Histogram
+handler_latency = {}  # handler name -> Histogram
+current_trace = contextvars.ContextVar("current_trace", default=None)  # [(span name, seconds)] of the handler
+
+def _observe(histograms: Dict, name: str, seconds: float):
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms[name] = Histogram(SPAN_BUCKETS)
+    histogram.observe(seconds)
+
+class Span:
+    """Times a `with` block into span_latency and the enclosing handler's trace"""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        _observe(span_latency, self.name, elapsed)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.append((self.name, elapsed))
+        return False
+
+_NO_SPAN = contextlib.nullcontext()
+
+def span(name: str):
+    return Span(name) if TRACING else _NO_SPAN
+
+def traced(name: str, slow_after: float = SLOW_REQUEST_SECONDS):
+    """Time a handler and the spans inside it, logging the breakdown when it takes slow_after seconds or more"""
+    def decorate(func):
+        if not TRACING:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            trace = []
+            token = current_trace.set(trace)
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                current_trace.reset(token)
+                _observe(handler_latency, name, elapsed)
+                if elapsed >= slow_after:
+                    totals = {}
+                    for span_name, seconds in trace:
+                        count, total = totals.get(span_name, (0, 0.0))
+                        totals[span_name] = (count + 1, total + seconds)
+                    breakdown = ", ".join(
+                        f"{span_name} {total:.3f}s" + (f" x{count}" if count > 1 else "")
+                        for span_name, (count, total) in totals.items()
+                    )
+                    logger.warning(f"Slow {name}: {elapsed:.2f}s ({breakdown or 'no spans'})")
+        return wrapper
+    return decorate
+
+class SamplingProfiler:
+    """Samples the event loop thread's stack from a helper thread while an admin has it on.
+
+    Stacks are counted in collapsed form ("outer;inner;leaf"), which flame
+    graph tools read directly. Nothing runs while it is off.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, max_seconds: int = PROFILE_MAX_SECONDS):
+        """Start sampling the calling thread (call from the event loop)"""
+        if self.running:
+            return
+        self.stacks = {}
+        self.samples = 0
+        self.started_at = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(threading.get_ident(), self.started_at + max_seconds), daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, thread_id: int, deadline: float):
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def top_functions(self, limit: int = 15) -> List[tuple]:
+        """(function, samples) with the most samples at the top of the stack"""
+        leaves = {}
+        for stack, count in self.stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        return sorted(leaves.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self.stacks.items()))
+
+profiler = SamplingProfiler(PROFILE_INTERVAL)
+
+# Streaming uploads
+class StreamingUpload:
+    """Read-only source for send_document that is fed by a download still in progress.
+
+    At most STREAM_BUFFER_SIZE bytes sit between the downloader and the
+    uploader, so memory stays bounded and nothing touches the disk.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, name: str, size: int, buffer_size: int):
+        self.name = name
+        self.size = size
+        self.received = 0
+        self.consumed = 0  # Bytes handed to the uploader, which can't be taken back
+        self._queue = asyncio.Queue(maxsize=max(1, buffer_size // self.CHUNK_SIZE))
+        self._pending = bytearray()
+        self._eof = False
+
+    async def pump(self, content: aiohttp.StreamReader, on_progress=None):
+        """Move the response body into the buffer, waiting whenever the uploader falls behind"""
+        try:
+            async for chunk in content.iter_chunked(self.CHUNK_SIZE):
+                await self._queue.put(chunk)
+                self.received += len(chunk)
+                if on_progress:
+                    await on_progress(self.received, self.size)
+        except Exception as e:
+            await self._queue.put(e)
+            raise
+        await self._queue.put(None)
+
+    async def read(self, size: int) -> bytes:
+        """Return exactly `size` bytes, or fewer only at the end of the stream"""
+        while len(self._pending) < size and not self._eof:
+            item = await self._queue.get()
+            if item is None:
+                self._eof = True
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                self._pending += item
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        self.consumed += len(data)
+        return data
+
+# Telegram rate limiting
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+telegram_priority = contextvars.ContextVar("telegram_priority", default=PRIORITY_INTERACTIVE)
+
+@contextlib.contextmanager
+def background_calls():
+    """Telegram calls made inside this block yield to interactive replies"""
+    token = telegram_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        telegram_priority.reset(token)
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`; a FloodWait empties it until it expires"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.paused_until  # Refill only from the end of the pause
+
+class TelegramRateLimiter:
+    """Admission control for every outbound Bot API call.
+
+    A call needs a token from the global bucket and from its own scope: the
+    chat's bucket for chat-scoped calls, otherwise a bucket per method. A
+    FloodWait pauses only that scope's bucket.
+    Background calls (progress edits, queue updates, cleanups) wait while
+    interactive calls are queued on the global bucket.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(TG_GLOBAL_RATE, TG_GLOBAL_BURST)
+        self._chats = OrderedDict()
+        self._methods = {}  # method name -> TokenBucket, for calls without a numeric chat id
+        self._interactive_waiting = 0
+        self.calls = 0
+        self.throttled = 0
+        self.flood_waits = 0
+        self.retried = 0
+        self.failed = 0
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                bucket = TokenBucket(TG_GROUP_RATE, TG_GROUP_BURST)
+            else:
+                bucket = TokenBucket(TG_CHAT_RATE, TG_CHAT_BURST)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > TG_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _scope_bucket(self, chat_id: Union[int, str, None], method: str) -> TokenBucket:
+        if isinstance(chat_id, int):
+            return self._chat_bucket(chat_id)
+        bucket = self._methods.get(method)
+        if bucket is None:
+            bucket = self._methods[method] = TokenBucket(TG_GLOBAL_RATE, TG_GLOBAL_BURST)
+        return bucket
+
+    async def acquire(self, chat_id: Union[int, str, None], method: str, priority: int):
+        scope = self._scope_bucket(chat_id, method)
+        throttled = False
+        queued = False
+        try:
+            while True:
+                now = time.monotonic()
+                global_wait = self.global_bucket.delay(now)
+                wait = max(global_wait, scope.delay(now))
+                yielding = priority > PRIORITY_INTERACTIVE and self._interactive_waiting
+                if wait <= 0 and not yielding:
+                    self.global_bucket.take()
+                    scope.take()
+                    return
+                if not throttled:
+                    throttled = True
+                    self.throttled += 1
+                if global_wait > 0 and priority == PRIORITY_INTERACTIVE and not queued:
+                    queued = True
+                    self._interactive_waiting += 1
+                await asyncio.sleep(max(wait, self.POLL_INTERVAL))
+        finally:
+            if queued:
+                self._interactive_waiting -= 1
+
+    async def call(self, chat_id: Union[int, str, None], func, /, *args, **kwargs):
+        """Run func(*args, **kwargs) once the buckets allow it.
+
+        Interactive calls are retried after short FloodWaits; background calls,
+        long waits and uploads from a StreamingUpload (which can't be read
+        twice) re-raise so the caller can drop or defer the update.
+        """
+        priority = telegram_priority.get()
+        replayable = not any(isinstance(arg, StreamingUpload) for arg in (*args, *kwargs.values()))
+        while True:
+            await self.acquire(chat_id, func.__name__, priority)
+            self.calls += 1
+            try:
+                with span("telegram_send"):
+                    return await func(*args, **kwargs)
+            except FloodWait as e:
+                self.flood_waits += 1
+                self._scope_bucket(chat_id, func.__name__).pause(e.value)
+                logger.warning(f"FloodWait of {e.value}s from {func.__name__} (chat {chat_id})")
+                if not replayable or priority != PRIORITY_INTERACTIVE or e.value > TG_MAX_RETRY_WAIT:
+                    self.failed += 1
+                    raise
+                self.retried += 1
+            except Exception:
+                self.failed += 1
+                raise
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "flood_waits": self.flood_waits,
+            "retried": self.retried,
+            "failed": self.failed,
+            "paused_chats": sum(1 for bucket in self._chats.values() if bucket.paused_until > time.monotonic()),
+        }
+
+telegram_limiter = TelegramRateLimiter()
+
+class FilmziClient(Client):
+    """Client whose uploads can also come from a StreamingUpload"""
+
+    UPLOAD_PART_SIZE = 512 * 1024
+
+    async def save_file(self, path, file_id: int = None, file_part: int = 0, progress=None, progress_args: tuple = ()):
+        if not isinstance(path, StreamingUpload):
+            return await super().save_file(path, file_id, file_part, progress, progress_args)
+        if file_id is not None:
+            # Parts already streamed past cannot be re-read
+            raise IOError(f"Telegram lost part {file_part} of a streamed upload")
+        return await self._save_stream(path, progress, progress_args)
+
+    async def _save_stream(self, stream: StreamingUpload, progress=None, progress_args: tuple = ()):
+        """Same chunked upload as Client.save_file, reading parts as they arrive"""
+        async with self.save_file_semaphore:
+            file_size_limit_mib = 4000 if self.me.is_premium else 2000
+            if stream.size > file_size_limit_mib * 1024 * 1024:
+                raise ValueError(f"Can't upload files bigger than {file_size_limit_mib} MiB")
+
+            part_size = self.UPLOAD_PART_SIZE
+            file_total_parts = int(math.ceil(stream.size / part_size))
+            is_big = stream.size > 10 * 1024 * 1024
+            upload_id = self.rnd_id()
+            md5_sum = None if is_big else md5()
+            session = Session(
+                self, await self.storage.dc_id(), await self.storage.auth_key(),
+                await self.storage.test_mode(), is_media=True
+            )
+            queue = asyncio.Queue(1)
+            errors = []
+
+            async def worker():
+                while True:
+                    rpc = await queue.get()
+                    if rpc is None:
+                        return
+                    try:
+                        await session.invoke(rpc)
+                    except Exception as e:
+                        errors.append(e)
+
+            workers = [self.loop.create_task(worker()) for _ in range(4 if is_big else 1)]
+            try:
+                await session.start()
+                part = 0
+                while not errors:
+                    chunk = await stream.read(part_size)
+                    if not chunk:
+                        break
+                    if is_big:
+                        rpc = raw.functions.upload.SaveBigFilePart(
+                            file_id=upload_id, file_part=part,
+                            file_total_parts=file_total_parts, bytes=chunk
+                        )
+                    else:
+                        rpc = raw.functions.upload.SaveFilePart(file_id=upload_id, file_part=part, bytes=chunk)
+                        md5_sum.update(chunk)
+                    await queue.put(rpc)
+                    part += 1
+                    if progress:
+                        await progress(min(part * part_size, stream.size), stream.size, *progress_args)
+            finally:
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+                await session.stop()
+
+            if errors:
+                raise errors[0]
+            if part != file_total_parts:
+                raise IOError(f"Stream ended after {part} of {file_total_parts} parts")
+            if is_big:
+                return raw.types.InputFileBig(id=upload_id, parts=file_total_parts, name=stream.name)
+            return raw.types.InputFile(
+                id=upload_id, parts=file_total_parts, name=stream.name, md5_checksum=md5_sum.hexdigest()
+            )
+
+def _rate_limited(name: str, chat_scoped: bool = True):
+    """Route Client.<name> through telegram_limiter"""
+    method = getattr(Client, name)
+
+    async def limited(self, *args, **kwargs):
+        chat_id = kwargs.get("chat_id", args[0] if args else None) if chat_scoped else None
+        return await telegram_limiter.call(chat_id, method, self, *args, **kwargs)
+
+    limited.__name__ = name
+    limited.__doc__ = method.__doc__
+    return limited
+
+# Message.reply_text, CallbackQuery.edit_message_text etc. all end up in these
+for _name in ("send_message", "edit_message_text", "edit_message_reply_markup", "send_photo",
+              "send_document", "send_cached_media", "delete_messages", "send_reaction"):
+    setattr(FilmziClient, _name, _rate_limited(_name))
+# Membership lookups get a bucket of their own instead of using the group's message budget
+FilmziClient.get_chat_member = _rate_limited("get_chat_member", chat_scoped=False)
 
 # Initialize the bot
-app = Client("Filmzi", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+app = FilmziClient("Filmzi", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+
+# Shared state backend
+class StateBackendError(Exception):
+    """The shared state store failed or rejected a command"""
+
+class StateBackend(ABC):
+    """Key/value, hash and set primitives the bot keeps in shared state.
+
+    `shared` says whether other workers see the same data. When it is False
+    (the in-memory backend), components rely on their local caches alone.
+    Keys are namespaced with STATE_PREFIX by the backend.
+    """
+
+    shared = False
+
+    @abstractmethod
+    async def get(self, key: str) -> Union[str, None]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: int = None, nx: bool = False) -> bool:
+        """Store value (optionally only if absent); False when nx and the key exists"""
+
+    @abstractmethod
+    async def delete(self, *keys: str):
+        ...
+
+    @abstractmethod
+    async def expire(self, key: str, ttl: int):
+        ...
+
+    @abstractmethod
+    async def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        ...
+
+    @abstractmethod
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        ...
+
+    @abstractmethod
+    async def sadd(self, key: str, *members: str) -> int:
+        """Add members to a set, returning how many were new"""
+
+    @abstractmethod
+    async def scard(self, key: str) -> int:
+        ...
+
+    async def close(self):
+        pass
+
+class MemoryBackend(StateBackend):
+    """Process-local backend with the same semantics as the Redis one, including expiry"""
+
+    def __init__(self):
+        self._data = {}  # key -> [value, expires_at or None]
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def _container(self, key: str, kind):
+        entry = self._live(key)
+        if entry is None:
+            entry = self._data[key] = [kind(), None]
+        elif not isinstance(entry[0], kind):
+            raise StateBackendError(f"WRONGTYPE {key} does not hold a {kind.__name__}")
+        return entry[0]
+
+    async def get(self, key: str) -> Union[str, None]:
+        entry = self._live(key)
+        if entry is not None and not isinstance(entry[0], str):
+            raise StateBackendError(f"WRONGTYPE {key} does not hold a string")
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: str, ttl: int = None, nx: bool = False) -> bool:
+        if nx and self._live(key) is not None:
+            return False
+        self._data[key] = [str(value), time.monotonic() + ttl if ttl else None]
+        return True
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def expire(self, key: str, ttl: int):
+        entry = self._live(key)
+        if entry is not None:
+            entry[1] = time.monotonic() + ttl
+
+    async def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        fields = self._container(key, dict)
+        fields[field] = str(int(fields.get(field, 0)) + amount)
+        return int(fields[field])
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        entry = self._live(key)
+        return dict(entry[0]) if entry and isinstance(entry[0], dict) else {}
+
+    async def sadd(self, key: str, *members: str) -> int:
+        members_set = self._container(key, set)
+        before = len(members_set)
+        members_set.update(str(member) for member in members)
+        return len(members_set) - before
+
+    async def scard(self, key: str) -> int:
+        entry = self._live(key)
+        return len(entry[0]) if entry and isinstance(entry[0], set) else 0
+
+class RedisBackend(StateBackend):
+    """Talks RESP to Redis (or anything speaking its protocol) over a small connection pool"""
+
+    shared = True
+
+    def __init__(self, url: str, pool_size: int, prefix: str):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = urllib.parse.unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self._slots = asyncio.Semaphore(pool_size)
+        self._idle = []
+
+    @staticmethod
+    def _encode(args: tuple) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts += [f"${len(data)}\r\n".encode(), data, b"\r\n"]
+        return b"".join(parts)
+
+    async def _read(self, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            return StateBackendError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await reader.readexactly(length + 2))[:-2].decode()
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read(reader) for _ in range(length)]
+        raise StateBackendError(f"Unexpected reply {line!r}")
+
+    async def _round_trip(self, connection: tuple, *args):
+        reader, writer = connection
+        writer.write(self._encode(args))
+        await writer.drain()
+        return await self._read(reader)
+
+    async def _connect(self) -> tuple:
+        connection = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), API_CONNECT_TIMEOUT)
+        for command in ((("AUTH", self.password),) if self.password else ()) + ((("SELECT", self.db),) if self.db else ()):
+            reply = await self._round_trip(connection, *command)
+            if isinstance(reply, StateBackendError):
+                connection[1].close()
+                raise reply
+        return connection
+
+    async def execute(self, *args):
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = await self._connect()
+                reply = await asyncio.wait_for(self._round_trip(connection, *args), API_READ_TIMEOUT)
+            except Exception as e:
+                if connection is not None:
+                    connection[1].close()
+                raise StateBackendError(f"{args[0]} failed: {e}") from e
+            self._idle.append(connection)
+        if isinstance(reply, StateBackendError):
+            raise reply
+        return reply
+
+    async def get(self, key: str) -> Union[str, None]:
+        return await self.execute("GET", self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: int = None, nx: bool = False) -> bool:
+        args = ["SET", self.prefix + key, value]
+        if ttl:
+            args += ["EX", int(ttl)]
+        if nx:
+            args.append("NX")
+        return await self.execute(*args) == "OK"
+
+    async def delete(self, *keys: str):
+        await self.execute("DEL", *(self.prefix + key for key in keys))
+
+    async def expire(self, key: str, ttl: int):
+        await self.execute("EXPIRE", self.prefix + key, int(ttl))
+
+    async def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        return await self.execute("HINCRBY", self.prefix + key, field, amount)
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        reply = await self.execute("HGETALL", self.prefix + key) or []
+        return dict(zip(reply[::2], reply[1::2]))
+
+    async def sadd(self, key: str, *members: str) -> int:
+        return await self.execute("SADD", self.prefix + key, *members)
+
+    async def scard(self, key: str) -> int:
+        return await self.execute("SCARD", self.prefix + key)
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+def create_state_backend() -> StateBackend:
+    if STATE_BACKEND == "redis":
+        logger.info(f"Sharing state through {REDIS_URL.rsplit('@', 1)[-1]} as worker {WORKER_ID}")
+        return RedisBackend(REDIS_URL, REDIS_POOL_SIZE, STATE_PREFIX)
+    return MemoryBackend()
+
+state_backend = create_state_backend()
 
 # User data cache
-user_data = {}
 user_stats = {}
-download_tasks = {}
+
+# Activity counters
+class ActivityCounters:
+    """Per-day and per-hour activity buckets, updated incrementally by track_user()"""
+
+    FIELDS = ("searches", "downloads", "active_users", "new_users")
+
+    def __init__(self, history_days: int):
+        self.history_days = history_days
+        self.buckets = {}  # "YYYY-MM-DD" or "YYYY-MM-DDTHH" -> counts
+        self.dirty = set()
+        self.cutoff = ""   # Buckets sorting before this key have been pruned
+
+    def _bucket(self, key: str, now: datetime) -> Dict:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = dict.fromkeys(self.FIELDS, 0)
+            if len(key) == 10:
+                self.prune(now)
+        return bucket
+
+    def prune(self, now: datetime):
+        self.cutoff = (now - timedelta(days=self.history_days)).strftime("%Y-%m-%d")
+        for key in [key for key in self.buckets if key < self.cutoff]:
+            del self.buckets[key]
+            self.dirty.discard(key)
+
+    def record(self, now: datetime, previous_seen: Union[str, None], action: str):
+        """Count one action; previous_seen is the user's last_seen before this action"""
+        for key in (now.strftime("%Y-%m-%d"), now.strftime("%Y-%m-%dT%H")):
+            bucket = self._bucket(key, now)
+            if previous_seen is None:
+                bucket["new_users"] += 1
+            # last_seen is ISO formatted, so its prefix identifies the same day/hour
+            if previous_seen is None or previous_seen[:len(key)] != key:
+                bucket["active_users"] += 1
+            if action == "search":
+                bucket["searches"] += 1
+            elif action == "download":
+                bucket["downloads"] += 1
+            self.dirty.add(key)
+
+    def day(self, date: datetime) -> Dict:
+        return self.buckets.get(date.strftime("%Y-%m-%d")) or dict.fromkeys(self.FIELDS, 0)
+
+    def history(self, days: int) -> List[tuple]:
+        """(date, counts) for the last `days` days, oldest first"""
+        today = datetime.now()
+        return [
+            (day.strftime("%Y-%m-%d"), self.day(day))
+            for day in (today - timedelta(days=offset) for offset in range(days - 1, -1, -1))
+        ]
+
+activity = ActivityCounters(STATS_HISTORY_DAYS)
+
+class SharedActivity:
+    """Activity deltas pushed to the state backend so every worker reports the same totals.
+
+    Searches and downloads are hash counters per bucket, active users a set
+    per bucket and known users one global set; a user is new when adding them
+    to that set adds a member. Without a shared backend the local counters answer.
+    """
+
+    def __init__(self, history_days: int):
+        self.ttl = (history_days + 1) * 86400
+        self._counts = {}   # bucket key -> {field: delta}
+        self._active = {}   # bucket key -> user ids
+        self._new = {}      # user id -> bucket keys of their first action here
+        self._known = []    # user ids to register without counting them as new
+
+    def record(self, now: datetime, user_id: str, previous_seen: Union[str, None], action: str):
+        if not state_backend.shared:
+            return
+        keys = (now.strftime("%Y-%m-%d"), now.strftime("%Y-%m-%dT%H"))
+        field = {"search": "searches", "download": "downloads"}.get(action)
+        for key in keys:
+            self._active.setdefault(key, set()).add(user_id)
+            if field:
+                counts = self._counts.setdefault(key, {})
+                counts[field] = counts.get(field, 0) + 1
+        if previous_seen is None:
+            self._new[user_id] = keys
+
+    def register(self, user_ids):
+        """Users this worker already knew before sharing state"""
+        if state_backend.shared:
+            self._known.extend(user_ids)
+
+    async def flush(self):
+        if not (self._counts or self._active or self._new or self._known):
+            return
+        counts, self._counts = self._counts, {}
+        active, self._active = self._active, {}
+        new, self._new = self._new, {}
+        known, self._known = self._known, []
+        try:
+            for start in range(0, len(known), 1000):
+                await state_backend.sadd("users", *known[start:start + 1000])
+            for user_id, keys in new.items():
+                if await state_backend.sadd("users", user_id):
+                    for key in keys:
+                        await state_backend.hincrby(f"activity:{key}", "new_users")
+            for key, fields in counts.items():
+                for field, amount in fields.items():
+                    await state_backend.hincrby(f"activity:{key}", field, amount)
+                await state_backend.expire(f"activity:{key}", self.ttl)
+            for key, user_ids in active.items():
+                await state_backend.sadd(f"active:{key}", *user_ids)
+                await state_backend.expire(f"active:{key}", self.ttl)
+        except Exception as e:
+            logger.error(f"Error sharing activity: {e}")
+
+    async def day(self, date: datetime) -> Dict:
+        if not state_backend.shared:
+            return activity.day(date)
+        key = date.strftime("%Y-%m-%d")
+        try:
+            counts = dict.fromkeys(ActivityCounters.FIELDS, 0)
+            counts.update({field: int(value) for field, value in (await state_backend.hgetall(f"activity:{key}")).items()})
+            counts["active_users"] = await state_backend.scard(f"active:{key}")
+            return counts
+        except Exception as e:
+            logger.error(f"Error reading shared activity: {e}")
+            return activity.day(date)
+
+    async def history(self, days: int) -> List[tuple]:
+        today = datetime.now()
+        return [
+            (day.strftime("%Y-%m-%d"), await self.day(day))
+            for day in (today - timedelta(days=offset) for offset in range(days - 1, -1, -1))
+        ]
+
+    async def total_users(self) -> int:
+        if state_backend.shared:
+            try:
+                return await state_backend.scard("users")
+            except Exception as e:
+                logger.error(f"Error reading shared user count: {e}")
+        return len(user_stats)
+
+shared_activity = SharedActivity(STATS_HISTORY_DAYS)
+
+# Statistics storage
+class StatsStore:
+    """SQLite (WAL) backed user stats with batched writes off the event loop"""
+
+    def __init__(self, path: str, flush_interval: int):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._conn = None
+        self._dirty = set()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "user_id TEXT PRIMARY KEY, first_seen TEXT, last_seen TEXT, "
+            "search_count INTEGER DEFAULT 0, download_count INTEGER DEFAULT 0)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS activity ("
+            "bucket TEXT PRIMARY KEY, searches INTEGER DEFAULT 0, downloads INTEGER DEFAULT 0, "
+            "active_users INTEGER DEFAULT 0, new_users INTEGER DEFAULT 0)"
+        )
+        conn.commit()
+        return conn
+
+    def _write(self, rows: List[tuple], buckets: List[tuple] = (), cutoff: str = ""):
+        with self._conn:
+            if buckets:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO activity "
+                    "(bucket, searches, downloads, active_users, new_users) VALUES (?, ?, ?, ?, ?)",
+                    buckets
+                )
+            if cutoff:
+                self._conn.execute("DELETE FROM activity WHERE bucket < ?", (cutoff,))
+            self._conn.executemany(
+                "INSERT INTO users (user_id, first_seen, last_seen, search_count, download_count) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+                "last_seen = excluded.last_seen, search_count = excluded.search_count, "
+                "download_count = excluded.download_count",
+                rows
+            )
+
+    @staticmethod
+    def _row(user_id: str, stats: Dict) -> tuple:
+        return (
+            user_id,
+            stats.get("first_seen"),
+            stats.get("last_seen"),
+            stats.get("search_count", 0),
+            stats.get("download_count", 0),
+        )
+
+    def _migrate_json(self) -> Dict:
+        with open(STATS_FILE, 'r') as f:
+            legacy = json.load(f)
+        self._write([self._row(user_id, stats) for user_id, stats in legacy.items()])
+        os.replace(STATS_FILE, f"{STATS_FILE}.migrated")
+        logger.info(f"Migrated {len(legacy)} users from {STATS_FILE} to {self.path}")
+        return legacy
+
+    def load_activity(self) -> Dict:
+        rows = self._conn.execute(
+            "SELECT bucket, searches, downloads, active_users, new_users FROM activity"
+        ).fetchall()
+        return {row[0]: dict(zip(ActivityCounters.FIELDS, row[1:])) for row in rows}
+
+    def load(self) -> Dict:
+        """Open the database and return all stored users (runs once at startup)"""
+        self._conn = self._connect()
+        rows = self._conn.execute(
+            "SELECT user_id, first_seen, last_seen, search_count, download_count FROM users"
+        ).fetchall()
+        if not rows and os.path.exists(STATS_FILE):
+            return self._migrate_json()
+        return {
+            user_id: {
+                "first_seen": first_seen,
+                "last_seen": last_seen,
+                "search_count": search_count,
+                "download_count": download_count,
+            }
+            for user_id, first_seen, last_seen, search_count, download_count in rows
+        }
+
+    def mark_dirty(self, user_id: str):
+        self._dirty.add(user_id)
+
+    async def flush(self):
+        """Write every user changed since the last flush in one transaction"""
+        await shared_activity.flush()
+        async with self._flush_lock:
+            if not (self._dirty or activity.dirty) or self._conn is None:
+                return
+            dirty, self._dirty = self._dirty, set()
+            dirty_buckets, activity.dirty = activity.dirty, set()
+            rows = [self._row(user_id, user_stats[user_id]) for user_id in dirty if user_id in user_stats]
+            buckets = [
+                (key, *(activity.buckets[key][field] for field in ActivityCounters.FIELDS))
+                for key in dirty_buckets if key in activity.buckets
+            ]
+            try:
+                await asyncio.to_thread(self._write, rows, buckets, activity.cutoff)
+            except Exception as e:
+                logger.error(f"Error saving stats: {e}")
+                self._dirty |= dirty
+                activity.dirty |= dirty_buckets
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+stats_store = StatsStore(STATS_DB, STATS_FLUSH_INTERVAL)
 
 # Load statistics
 def load_stats():
     global user_stats
     try:
-        if os.path.exists(STATS_FILE):
-            with open(STATS_FILE, 'r') as f:
-                user_stats = json.load(f)
+        user_stats = stats_store.load()
+        activity.buckets = stats_store.load_activity()
+        activity.prune(datetime.now())
+        shared_activity.register(list(user_stats))
     except Exception as e:
         logger.error(f"Error loading stats: {e}")
 
-# Save statistics
-def save_stats():
-    try:
-        with open(STATS_FILE, 'w') as f:
-            json.dump(user_stats, f)
-    except Exception as e:
-        logger.error(f"Error saving stats: {e}")
-
 # Track user activity
 def track_user(user_id: int, action: str):
     try:
         user_id = str(user_id)
+        now = datetime.now()
+        previous_seen = user_stats[user_id]["last_seen"] if user_id in user_stats else None
         if user_id not in user_stats:
             user_stats[user_id] = {
-                "first_seen": datetime.now().isoformat(),
-                "last_seen": datetime.now().isoformat(),
+                "first_seen": now.isoformat(),
+                "last_seen": now.isoformat(),
                 "search_count": 0,
                 "download_count": 0
             }
-        user_stats[user_id]["last_seen"] = datetime.now().isoformat()
+        user_stats[user_id]["last_seen"] = now.isoformat()
         
         if action == "search":
             user_stats[user_id]["search_count"] = user_stats[user_id].get("search_count", 0) + 1
         elif action == "download":
             user_stats[user_id]["download_count"] = user_stats[user_id].get("download_count", 0) + 1
             
-        save_stats()
+        activity.record(now, previous_seen, action)
+        shared_activity.record(now, user_id, previous_seen, action)
+        stats_store.mark_dirty(user_id)
     except Exception as e:
         logger.error(f"Error tracking user: {e}")
 
+# Membership cache
+class MembershipCache:
+    """Per-user membership results; positives are trusted longer than negatives"""
+
+    def __init__(self, ttl: int, negative_ttl: int, max_size: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # user id -> (expires_at, is_member)
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.api_calls = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Union[bool, None]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id: int, is_member: bool):
+        ttl = self.ttl if is_member else self.negative_ttl
+        self._entries[user_id] = (time.monotonic() + ttl, is_member)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    async def get_shared(self, user_id: int) -> Union[bool, None]:
+        """Another worker's recent answer, copied into the local cache"""
+        if not state_backend.shared:
+            return None
+        try:
+            value = await state_backend.get(f"membership:{user_id}")
+        except Exception as e:
+            logger.error(f"Error reading shared membership: {e}")
+            return None
+        if value is None:
+            return None
+        self.shared_hits += 1
+        self.put(user_id, value == "1")
+        return value == "1"
+
+    async def put_shared(self, user_id: int, is_member: bool):
+        if not state_backend.shared:
+            return
+        try:
+            await state_backend.set(
+                f"membership:{user_id}", "1" if is_member else "0",
+                ttl=self.ttl if is_member else self.negative_ttl
+            )
+        except Exception as e:
+            logger.error(f"Error sharing membership: {e}")
+
+    async def invalidate_shared(self, user_id: int):
+        """Forget the user everywhere; other workers' local copies still last until they expire"""
+        self.invalidate(user_id)
+        if not state_backend.shared:
+            return
+        try:
+            await state_backend.delete(f"membership:{user_id}")
+        except Exception as e:
+            logger.error(f"Error invalidating shared membership: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_hits": self.shared_hits,
+            "api_calls": self.api_calls,
+            "api_calls_saved": self.hits,
+            "invalidations": self.invalidations,
+        }
+
+membership_cache = MembershipCache(MEMBERSHIP_TTL, MEMBERSHIP_NEGATIVE_TTL, MEMBERSHIP_CACHE_SIZE)
+
 # Check if user is member of movie group
-async def check_user_membership(client: Client, user_id: int) -> bool:
+async def check_user_membership(client: Client, user_id: int, force_refresh: bool = False) -> bool:
+    if not force_refresh:
+        cached = membership_cache.get(user_id)
+        if cached is None:
+            cached = await membership_cache.get_shared(user_id)
+        if cached is not None:
+            return cached
     try:
-        member = await client.get_chat_member(MOVIE_GROUP_ID, user_id)
-        return member.status not in ["left", "kicked"]
+        membership_cache.api_calls += 1
+        with span("membership"):
+            member = await client.get_chat_member(MOVIE_GROUP_ID, user_id)
+        is_member = member.status not in ["left", "kicked"]
     except UserNotParticipant:
-        return False
+        is_member = False
     except Exception as e:
+        # Don't cache transient failures
         logger.error(f"Error checking membership: {e}")
         return False
+    membership_cache.put(user_id, is_member)
+    await membership_cache.put_shared(user_id, is_member)
+    return is_member
 
 # Enhanced URL processing for direct file access
 def process_video_url(url: str) -> str:
@@ -173,230 +1324,2057 @@ async def get_file_size(url: str) -> tuple:
         logger.error(f"Error getting file info: {e}")
         return (0, "", False)
 
+# Partial download state
+class DownloadState:
+    """Sidecar <file>.state.json that lets a partial download resume.
+
+    It records the source URL and validator (ETag or Last-Modified) checked by
+    If-Range, which pieces of a segmented download are complete, and the job
+    that requested the file so a restarted bot can finish and deliver it.
+    """
+
+    SUFFIX = ".state.json"
+
+    def __init__(self, file_path: str, data: Dict = None):
+        self.file_path = file_path
+        self.path = file_path + self.SUFFIX
+        self.data = data or {}
+
+    def load(self, url: str) -> bool:
+        """Read the sidecar, keeping it only if it describes a download of `url`"""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("url") != url or not os.path.exists(self.file_path):
+            return False
+        self.data.update(data)
+        return True
+
+    def matches(self, url: str, size: int, validator: str) -> bool:
+        return (
+            self.data.get("url") == url
+            and self.data.get("size") == size
+            and bool(validator)
+            and self.data.get("validator") == validator
+        )
+
+    def _write(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+    async def save(self, **fields):
+        self.data.update(fields, updated_at=time.time())
+        try:
+            await asyncio.to_thread(self._write)
+        except Exception as e:
+            logger.error(f"Error saving download state: {e}")
+
+    async def mark_failed(self):
+        """Keep the partial file for the next attempt, but don't resume this job after a restart"""
+        if os.path.exists(self.path):
+            await self.save(failed=True)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+# Downloaded video cache
+class VideoCache:
+    """Completed downloads in TEMP_DIR, keyed by source URL, kept within a byte budget.
+
+    Eviction looks at the least recently used entries and drops the one with
+    the fewest hits, so a title that keeps being requested outlives a burst of
+    one-off downloads. The index is a JSON file next to the videos so the
+    cache survives restarts, and a periodic sweep also evicts whenever free
+    disk space falls below VIDEO_CACHE_MIN_FREE.
+    """
+
+    EVICTION_SAMPLE = 8
+
+    def __init__(self, directory: str, max_bytes: int, min_free: int, index_path: str):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_free = min_free
+        self.index_path = index_path
+        self._entries = OrderedDict()  # source url -> {"path", "size", "hits", "last_used"}, oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._dirty = False
+        self._task = None
+
+    def load(self):
+        """Read the index, dropping entries whose file has gone (runs once at startup)"""
+        try:
+            with open(self.index_path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        for entry in sorted(entries, key=lambda entry: entry.get("last_used", 0)):
+            if os.path.exists(entry.get("path", "")):
+                self._entries[entry["url"]] = {key: entry[key] for key in ("path", "size", "hits", "last_used")}
+                self.total_bytes += entry["size"]
+        logger.info(f"Video cache holds {len(self._entries)} files ({format_file_size(self.total_bytes)})")
+
+    def get(self, url: str) -> Union[str, None]:
+        """Path of the cached download of url, if there is one"""
+        entry = self._entries.get(url)
+        if entry is None or not os.path.exists(entry["path"]):
+            if entry is not None:
+                self._drop(url)
+            self.misses += 1
+            return None
+        entry["hits"] += 1
+        entry["last_used"] = time.time()
+        self._entries.move_to_end(url)
+        self._dirty = True
+        self.hits += 1
+        return entry["path"]
+
+    async def put(self, url: str, path: str):
+        """Adopt a finished download, evicting others if it pushes the cache over budget"""
+        if url in self._entries:
+            self._drop(url)
+        size = os.path.getsize(path)
+        self._entries[url] = {"path": path, "size": size, "hits": 0, "last_used": time.time()}
+        self.total_bytes += size
+        self._dirty = True
+        await self.sweep()
+
+    def _drop(self, url: str, delete: bool = False):
+        entry = self._entries.pop(url)
+        self.total_bytes -= entry["size"]
+        self._dirty = True
+        if delete:
+            try:
+                os.remove(entry["path"])
+            except FileNotFoundError:
+                pass
+
+    def _victim(self) -> Union[str, None]:
+        """Least-hit entry among the least recently used ones that nobody is uploading"""
+        candidates = []
+        for url, entry in self._entries.items():
+            if url in shared_transfers:
+                continue
+            candidates.append((entry["hits"], entry["last_used"], url))
+            if len(candidates) >= self.EVICTION_SAMPLE:
+                break
+        return min(candidates)[2] if candidates else None
+
+    def _free_space(self) -> int:
+        try:
+            return shutil.disk_usage(self.directory).free
+        except OSError:
+            return self.min_free
+
+    def _partials(self, busy: set) -> List[tuple]:
+        """(last update, failed, path) of partial downloads not in flight, oldest first"""
+        partials = []
+        for entry in os.listdir(self.directory):
+            if not entry.endswith(DownloadState.SUFFIX):
+                continue
+            path = os.path.join(self.directory, entry[:-len(DownloadState.SUFFIX)])
+            try:
+                with open(path + DownloadState.SUFFIX, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get("url") not in busy and os.path.isfile(path):
+                partials.append((data.get("updated_at", 0), bool(data.get("failed")), path))
+        return sorted(partials)
+
+    def _remove_partial(self, path: str):
+        for stale in (path, path + DownloadState.SUFFIX):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        logger.info(f"Removed partial download {os.path.basename(path)}")
+
+    def _remove_orphans(self, busy: set):
+        """Delete stray files from before the cache existed, and failed or abandoned partial downloads"""
+        known = {entry["path"] for entry in self._entries.values()}
+        cutoff = time.time() - RESUME_MAX_AGE
+        for updated_at, failed, path in self._partials(busy):
+            if failed or updated_at < cutoff:
+                self._remove_partial(path)
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            if (
+                path in known or path == self.index_path or entry.endswith((DownloadState.SUFFIX, ".tmp"))
+                or os.path.exists(path + DownloadState.SUFFIX) or not os.path.isfile(path)
+            ):
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    logger.info(f"Removed orphaned download {entry}")
+            except OSError:
+                pass
+
+    async def sweep(self, orphans: bool = False):
+        """Evict until the cache is within budget and the disk has enough free space.
+
+        Partial downloads go first when the disk runs low, oldest first, since
+        they are not in the cache's byte budget at all.
+        """
+        try:
+            busy = set(shared_transfers)
+            if orphans:
+                await asyncio.to_thread(self._remove_orphans, busy)
+            if self._free_space() < self.min_free:
+                for _, _, path in await asyncio.to_thread(self._partials, busy):
+                    await asyncio.to_thread(self._remove_partial, path)
+                    if self._free_space() >= self.min_free:
+                        break
+            while self._entries and (self.total_bytes > self.max_bytes or self._free_space() < self.min_free):
+                url = self._victim()
+                if url is None:
+                    break
+                path = self._entries[url]["path"]
+                await asyncio.to_thread(self._drop, url, True)
+                self.evictions += 1
+                logger.info(f"Evicted cached video {os.path.basename(path)}")
+            await self.save()
+        except Exception as e:
+            logger.error(f"Video cache sweep error: {e}")
+
+    def _write(self, entries: List[Dict]):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.index_path)
+
+    async def save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        entries = [dict(entry, url=url) for url, entry in self._entries.items()]
+        try:
+            await asyncio.to_thread(self._write, entries)
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"Error saving video cache index: {e}")
+
+    async def _sweep_loop(self):
+        while True:
+            await self.sweep(orphans=True)
+            await asyncio.sleep(VIDEO_CACHE_SWEEP_INTERVAL)
+
+    def start(self):
+        self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        await self.save()
+
+    def stats(self) -> Dict:
+        return {
+            "files": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+video_cache = VideoCache(TEMP_DIR, VIDEO_CACHE_BYTES, VIDEO_CACHE_MIN_FREE, VIDEO_CACHE_INDEX)
+
 # File downloader with progress tracking
-async def download_file_with_progress(url: str, file_path: str, client: Client, chat_id: int, message_id: int):
-    """Download file with progress updates"""
+def source_timeout() -> aiohttp.ClientTimeout:
+    """No overall limit, since a large transfer can take hours; only connecting and each read are bounded"""
+    return aiohttp.ClientTimeout(total=None, sock_connect=API_CONNECT_TIMEOUT, sock_read=SOURCE_READ_TIMEOUT)
+
+async def download_file_with_progress(url: str, file_path: str, on_progress=None, state: DownloadState = None):
+    """Download file with progress updates, resuming after dropped connections"""
+    attempt = 0
+    while True:
+        result = await _download_single_stream(url, file_path, on_progress, state)
+        if result is not None:
+            return result
+        attempt += 1
+        if attempt > DOWNLOAD_RETRIES:
+            return False
+        delay = random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+        logger.warning(f"Download of {url} interrupted, resuming in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+async def _download_single_stream(url: str, file_path: str, on_progress=None,
+                                  state: DownloadState = None) -> Union[bool, None]:
+    """One download attempt: True/False when finished, None when worth resuming"""
+    offset = 0
+    headers = {}
+    if state and state.data.get("mode") == "single" and state.data.get("validator") and os.path.exists(file_path):
+        offset = os.path.getsize(file_path)
+        if offset:
+            headers = {"Range": f"bytes={offset}-", "If-Range": state.data["validator"]}
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status != 200:
+        async with aiohttp.ClientSession(timeout=source_timeout()) as session:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 206 and response.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+                    mode = 'ab'
+                elif response.status == 200:
+                    # Fresh download, or the file changed since the partial copy was made
+                    offset = 0
+                    mode = 'wb'
+                else:
                     return False
                 
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded = 0
-                start_time = datetime.now()
+                total_size = offset + int(response.headers.get('content-length', 0))
+                downloaded = offset
+                if state:
+                    etag = response.headers.get("ETag")
+                    validator = etag if etag and not etag.startswith("W/") else response.headers.get("Last-Modified")
+                    await state.save(url=url, mode="single", size=total_size, validator=validator)
                 
-                async with aiofiles.open(file_path, 'wb') as f:
+                async with aiofiles.open(file_path, mode) as f:
                     async for chunk in response.content.iter_chunked(8192):
                         await f.write(chunk)
                         downloaded += len(chunk)
                         
-                        # Update progress every 5% or 5 seconds
-                        elapsed = (datetime.now() - start_time).seconds
-                        progress_percent = (downloaded / total_size) * 100
-                        
-                        if elapsed >= 5 or progress_percent % 5 < 0.5:
-                            progress_bar = "⬢" * int(progress_percent / 5) + "⬡" * (20 - int(progress_percent / 5))
-                            speed = downloaded / (elapsed + 1) / 1024  # KB/s
-                            
-                            try:
-                                await client.edit_message_text(
-                                    chat_id=chat_id,
-                                    message_id=message_id,
-                                    text=(
-                                        f"**⬇️ Downloading file...**\n\n"
-                                        f"{progress_bar} {progress_percent:.1f}%\n\n"
-                                        f"**📦 Size:** {format_file_size(total_size)}\n"
-                                        f"**🚀 Speed:** {speed:.1f} KB/s\n"
-                                        f"**⏱️ Estimated:** {format_eta(total_size - downloaded, speed)}"
-                                    )
-                                )
-                            except:
-                                pass
+                        if on_progress:
+                            await on_progress(downloaded, total_size)
+                if total_size > offset and downloaded < total_size:
+                    return None
         return True
+    except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+        logger.error(f"Download error: {e}")
+        return None
     except Exception as e:
         logger.error(f"Download error: {e}")
         return False
 
+# Parallel ranged downloads
+class RangesNotSupported(Exception):
+    """The source ignored a Range request"""
+
+async def probe_source(url: str) -> Dict:
+    """Ask for the first byte to learn the size and whether byte ranges are honoured"""
+    info = {"size": 0, "ranges": False, "validator": None}
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, headers={"Range": "bytes=0-0"}) as response:
+                content_range = response.headers.get("Content-Range", "")
+                if response.status == 206 and "/" in content_range:
+                    total = content_range.rsplit("/", 1)[1]
+                    info["size"] = int(total) if total.isdigit() else 0
+                    info["ranges"] = info["size"] > 0
+                elif response.status == 200:
+                    info["size"] = response.content_length or 0
+                # Strong validator so every piece comes from the same version of the file
+                etag = response.headers.get("ETag")
+                if etag and not etag.startswith("W/"):
+                    info["validator"] = etag
+                else:
+                    info["validator"] = response.headers.get("Last-Modified")
+    except Exception as e:
+        logger.warning(f"Could not probe {url}: {e}")
+    return info
+
+class SegmentedDownload:
+    """Download one file over several ranged connections into a preallocated file.
+
+    The file is split into PARALLEL_PIECE_SIZE pieces taken from a shared
+    queue. It starts with PARALLEL_MIN_CONNECTIONS workers and adds one more
+    each interval while aggregate throughput keeps improving. A failed piece
+    is retried from its last written byte without disturbing the others.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    WRITE_SIZE = 1024 * 1024
+    ADJUST_INTERVAL = 2.0
+
+    def __init__(self, url: str, file_path: str, total_size: int, validator: str = None, on_progress=None,
+                 state: DownloadState = None):
+        self.url = url
+        self.file_path = file_path
+        self.total_size = total_size
+        self.validator = validator
+        self.on_progress = on_progress
+        self.state = state
+        self.downloaded = 0
+        self.connections = 0
+
+        # Pieces finished before an interruption are kept if the file is unchanged
+        self.piece_size = PARALLEL_PIECE_SIZE
+        self._done = set()
+        if state and state.data.get("mode") == "segmented" and state.matches(url, total_size, validator):
+            self.piece_size = state.data.get("piece_size", PARALLEL_PIECE_SIZE)
+            self._done = set(state.data.get("done_pieces", []))
+        self._pieces = deque()
+        for start in range(0, total_size, self.piece_size):
+            end = min(start + self.piece_size, total_size) - 1
+            if start in self._done:
+                self.downloaded += end - start + 1
+            else:
+                self._pieces.append((start, end))
+        self._fd = None
+        self._session = None
+
+    async def _write(self, data: bytes, offset: int):
+        await asyncio.to_thread(os.pwrite, self._fd, data, offset)
+        self.downloaded += len(data)
+        if self.on_progress:
+            await self.on_progress(self.downloaded, self.total_size)
+
+    async def _fetch_piece(self, start: int, end: int):
+        offset = start
+        attempt = 0
+        while offset <= end:
+            headers = {"Range": f"bytes={offset}-{end}"}
+            if self.validator:
+                headers["If-Range"] = self.validator
+            try:
+                async with self._session.get(self.url, headers=headers) as response:
+                    if response.status == 200:
+                        raise RangesNotSupported()
+                    if response.status != 206:
+                        raise IOError(f"HTTP {response.status} for bytes {offset}-{end}")
+                    buffer = bytearray()
+                    async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                        buffer += chunk
+                        if len(buffer) >= self.WRITE_SIZE:
+                            await self._write(bytes(buffer), offset)
+                            offset += len(buffer)
+                            buffer.clear()
+                    if buffer:
+                        await self._write(bytes(buffer), offset)
+                        offset += len(buffer)
+                if offset <= end:
+                    raise IOError(f"Connection closed at byte {offset} of piece {start}-{end}")
+            except (aiohttp.ClientError, asyncio.TimeoutError, IOError) as e:
+                attempt += 1
+                if attempt > PARALLEL_PIECE_RETRIES:
+                    raise
+                delay = random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+                logger.warning(f"Piece {start}-{end} failed ({e!r}), retrying from {offset} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _save_state(self):
+        if self.state:
+            await self.state.save(
+                url=self.url, mode="segmented", size=self.total_size, validator=self.validator,
+                piece_size=self.piece_size, done_pieces=sorted(self._done)
+            )
+
+    async def _worker(self):
+        while self._pieces:
+            start, end = self._pieces.popleft()
+            await self._fetch_piece(start, end)
+            self._done.add(start)
+            await self._save_state()
+
+    def _add_worker(self, tasks: set):
+        tasks.add(asyncio.create_task(self._worker()))
+        self.connections += 1
+
+    async def run(self) -> Union[bool, None]:
+        """True on success, False on failure, None if the source turned out not to support ranges"""
+        tasks = set()
+        try:
+            if not self._done:
+                await self._save_state()
+            self._fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT, 0o644)
+            os.ftruncate(self._fd, self.total_size)
+            connector = aiohttp.TCPConnector(limit=PARALLEL_MAX_CONNECTIONS, ttl_dns_cache=300)
+            async with aiohttp.ClientSession(connector=connector) as self._session:
+                for _ in range(min(PARALLEL_MIN_CONNECTIONS, len(self._pieces))):
+                    self._add_worker(tasks)
+
+                growing = True
+                best_rate = 0.0
+                last_bytes = 0
+                last_time = time.monotonic()
+                while tasks:
+                    done, tasks = await asyncio.wait(
+                        tasks, timeout=self.ADJUST_INTERVAL, return_when=asyncio.FIRST_EXCEPTION
+                    )
+                    for task in done:
+                        if task.exception():
+                            raise task.exception()
+
+                    # Add a connection while each extra one still buys throughput
+                    now = time.monotonic()
+                    rate = (self.downloaded - last_bytes) / max(now - last_time, 1e-6)
+                    last_bytes, last_time = self.downloaded, now
+                    if growing and self._pieces and self.connections < PARALLEL_MAX_CONNECTIONS:
+                        if rate > best_rate * 1.1:
+                            best_rate = rate
+                            self._add_worker(tasks)
+                        else:
+                            growing = False
+            return self.downloaded == self.total_size
+        except RangesNotSupported:
+            logger.info(f"{self.url} ignores ranges, falling back to a single stream")
+            return None
+        except Exception as e:
+            logger.error(f"Segmented download error: {e}")
+            return False
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            if self._fd is not None:
+                os.close(self._fd)
+
+# Download progress reporting
+class ProgressReporter:
+    """Turns a stream of byte counts into occasional status message edits.
+
+    Edits go out at most once per interval and only when the rendered text
+    changed. A FloodWait pauses edits to that chat for as long as Telegram
+    asks. Speed and ETA come from the last `window` seconds, not the whole run.
+    """
+
+    SAMPLE_INTERVAL = 0.5
+
+    def __init__(self, client: Client, targets: List, interval: float = PROGRESS_INTERVAL,
+                 window: float = PROGRESS_WINDOW):
+        self.client = client
+        self.targets = targets  # (chat_id, message_id, download job id or None)
+        self.interval = interval
+        self.window = window
+        self._samples = deque()  # (monotonic time, bytes downloaded)
+        self._next_edit = time.monotonic() + interval
+        self._sent_text = {}  # (chat id, message id) -> last text shown
+        self._paused_until = {}
+
+    def _record(self, now: float, downloaded: int):
+        if self._samples and now - self._samples[-1][0] < self.SAMPLE_INTERVAL:
+            return
+        self._samples.append((now, downloaded))
+        # Keep one sample older than the window so the rate always spans it
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+            self._samples.popleft()
+
+    def speed(self) -> float:
+        """Bytes per second over the sliding window"""
+        if len(self._samples) < 2:
+            return 0.0
+        (first_time, first_bytes), (last_time, last_bytes) = self._samples[0], self._samples[-1]
+        if last_time <= first_time:
+            return 0.0
+        return max(last_bytes - first_bytes, 0) / (last_time - first_time)
+
+    async def update(self, downloaded: int, total: int):
+        now = time.monotonic()
+        self._record(now, downloaded)
+        if now < self._next_edit:
+            return
+        self._next_edit = now + self.interval
+        text = download_progress_text(downloaded, total, self.speed() / 1024)
+        with background_calls():
+            await self._send(text, now)
+
+    async def _send(self, text: str, now: float):
+        for chat_id, message_id, job_id in list(self.targets):
+            if self._paused_until.get(chat_id, 0) > now or self._sent_text.get((chat_id, message_id)) == text:
+                continue
+            try:
+                await self.client.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    text=text,
+                    reply_markup=download_cancel_markup(job_id)
+                )
+                self._sent_text[chat_id, message_id] = text
+            except MessageNotModified:
+                self._sent_text[chat_id, message_id] = text
+            except FloodWait as e:
+                logger.warning(f"FloodWait of {e.value}s on progress updates for chat {chat_id}")
+                self._paused_until[chat_id] = now + e.value
+            except Exception as e:
+                logger.debug(f"Progress update failed for chat {chat_id}: {e}")
+
+# In-flight transfer deduplication
+class SharedTransfer:
+    """One download + upload of a source URL that any number of chats can wait on.
+
+    The first requester does the work; everyone else subscribes, sees the same
+    progress, and gets the resulting Telegram file_id re-sent to them.
+    """
+
+    CANCELLED = object()
+
+    def __init__(self, client: Client, url: str):
+        self.client = client
+        self.url = url
+        self.subscribers = []  # (chat_id, status message id, job id); the first one owns the transfer
+        self.reporter = ProgressReporter(client, self.subscribers)
+        self._done = asyncio.get_running_loop().create_future()
+
+    def subscribe(self, chat_id: int, message_id: int):
+        """Show progress on this status message, with a cancel button for the calling download job"""
+        self.subscribers.append((chat_id, message_id, current_download_job.get()))
+
+    def unsubscribe(self, chat_id: int, message_id: int):
+        self.subscribers[:] = [
+            subscriber for subscriber in self.subscribers if subscriber[:2] != (chat_id, message_id)
+        ]
+
+    def finish(self, result):
+        """Hand (file_id, size), None on failure, or CANCELLED to every waiter; returns result"""
+        if not self._done.done():
+            self._done.set_result(result)
+        return result
+
+    async def wait(self):
+        return await asyncio.shield(self._done)
+
+    async def progress(self, downloaded: int, total: int):
+        await self.reporter.update(downloaded, total)
+
+class DownloadLock:
+    """Claim on downloading a source URL across workers sharing a state backend.
+
+    The holder keeps a lease (SET NX with a TTL, renewed while it works) and
+    publishes the outcome under a result key; other workers poll for it and
+    try again if the lease disappears without one. With the in-memory backend
+    the SharedTransfer map already covers the only worker, so acquire() always wins.
+    """
+
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, url: str):
+        digest = md5(url.encode()).hexdigest()
+        self.key = f"lock:download:{digest}"
+        self.result_key = f"transfer:{digest}"
+        self.token = f"{WORKER_ID}:{random.getrandbits(64):016x}"
+        self._held = False
+        self._renewer = None
+
+    async def acquire(self) -> bool:
+        if not state_backend.shared:
+            return True
+        try:
+            self._held = await state_backend.set(self.key, self.token, ttl=DOWNLOAD_LOCK_TTL, nx=True)
+            if self._held:
+                await state_backend.delete(self.result_key)  # A stale outcome from an earlier attempt
+        except Exception as e:
+            logger.error(f"Error taking download lock, downloading without it: {e}")
+            return True
+        if self._held:
+            self._renewer = asyncio.create_task(self._renew())
+        return self._held
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(DOWNLOAD_LOCK_TTL / 3)
+            try:
+                if await state_backend.get(self.key) != self.token:
+                    logger.warning(f"Download lock {self.key} was lost")
+                    return
+                await state_backend.expire(self.key, DOWNLOAD_LOCK_TTL)
+            except Exception as e:
+                logger.error(f"Error renewing download lock: {e}")
+
+    async def release(self, result):
+        """Publish (file_id, size), None on failure, or nothing when CANCELLED, then drop the lease"""
+        if not self._held:
+            return
+        self._held = False
+        if self._renewer:
+            self._renewer.cancel()
+        try:
+            if result is not SharedTransfer.CANCELLED:
+                outcome = {"failed": True} if result is None else {"file_id": result[0], "size": result[1]}
+                await state_backend.set(self.result_key, json.dumps(outcome), ttl=TRANSFER_RESULT_TTL)
+            if await state_backend.get(self.key) == self.token:
+                await state_backend.delete(self.key)
+        except Exception as e:
+            logger.error(f"Error releasing download lock: {e}")
+
+    async def wait(self):
+        """The holder's outcome like SharedTransfer.wait(); CANCELLED when its lease ends without one"""
+        while True:
+            try:
+                value = await state_backend.get(self.result_key)
+                if value is None and await state_backend.get(self.key) is None:
+                    value = await state_backend.get(self.result_key)
+                    if value is None:
+                        return SharedTransfer.CANCELLED
+            except Exception as e:
+                logger.error(f"Error polling download lock: {e}")
+                return SharedTransfer.CANCELLED
+            if value is not None:
+                outcome = json.loads(value)
+                return None if outcome.get("failed") else (outcome["file_id"], outcome["size"])
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+shared_transfers = {}  # processed source URL -> SharedTransfer
+
+def download_progress_text(downloaded: int, total_size: int, speed: float) -> str:
+    """Status message body; speed is in KB/s and total_size is 0 when the source didn't say"""
+    if not total_size:
+        return (
+            f"**⬇️ Downloading file...**\n\n"
+            f"**📦 Downloaded:** {format_file_size(downloaded)}\n"
+            f"**🚀 Speed:** {speed:.1f} KB/s\n"
+            f"**⏱️ Estimated:** Unknown size"
+        )
+    progress_percent = min(downloaded / total_size * 100, 100)
+    progress_bar = "⬢" * int(progress_percent / 5) + "⬡" * (20 - int(progress_percent / 5))
+    return (
+        f"**⬇️ Downloading file...**\n\n"
+        f"{progress_bar} {progress_percent:.1f}%\n\n"
+        f"**📦 Size:** {format_file_size(total_size)}\n"
+        f"**🚀 Speed:** {speed:.1f} KB/s\n"
+        f"**⏱️ Estimated:** {format_eta(total_size - downloaded, speed)}"
+    )
+
+# Streaming download + upload
+async def stream_document(client: Client, url: str, file_name: str, chat_id: int, on_progress,
+                          make_caption, reply_markup: InlineKeyboardMarkup) -> Union[tuple, None]:
+    """Upload url to chat_id while it downloads, returning (message, size).
+
+    Returns None without sending anything when the source does not announce
+    its size, since Telegram needs the part count before the first part, or
+    when it fails before the first part was uploaded; the caller then
+    downloads to disk instead.
+    """
+    async with aiohttp.ClientSession(timeout=source_timeout()) as session:
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise IOError(f"Source returned HTTP {response.status}")
+            total_size = response.content_length
+            if not total_size:
+                return None
+
+            stream = StreamingUpload(file_name, total_size, STREAM_BUFFER_SIZE)
+            pump = asyncio.create_task(stream.pump(response.content, on_progress))
+            upload_error = None
+            try:
+                sent = await client.send_document(
+                    chat_id=chat_id,
+                    document=stream,
+                    file_name=file_name,
+                    caption=make_caption(total_size),
+                    reply_markup=reply_markup
+                )
+            except Exception as e:
+                upload_error = e
+            finally:
+                if not pump.done():
+                    pump.cancel()
+                await asyncio.wait([pump])
+            # A source read error is the real cause of a failed upload; don't lose it
+            source_error = None if pump.cancelled() else pump.exception()
+            if source_error is not None:
+                if not stream.consumed:
+                    logger.warning(f"Source failed before the first part was uploaded, downloading instead: {source_error}")
+                    return None
+                raise source_error
+            if upload_error is not None:
+                raise upload_error
+            return sent, total_size
+
+# Telegram file_id cache
+class FileIdCache:
+    """Persistent map from (media, quality/episode) to the Telegram file_id of its upload.
+
+    Entries remember the source URL they were uploaded from, so a changed link
+    in the catalog is treated as a miss and the file is fetched again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._write_lock = asyncio.Lock()  # One transaction at a time on the shared connection
+        self._entries = {}  # key -> (source_url, file_id, file_size)
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    @staticmethod
+    def key(media_id, quality: str = None, episode_info: Dict = None) -> str:
+        if episode_info:
+            return f"{media_id}:s{episode_info['season']}e{episode_info['episode']}:{quality or 'auto'}"
+        return f"{media_id}:{quality or 'auto'}"
+
+    def load(self):
+        """Open the database and read every entry into memory (runs once at startup)"""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            "cache_key TEXT PRIMARY KEY, source_url TEXT, file_id TEXT, "
+            "file_size INTEGER, created_at TEXT)"
+        )
+        self._conn.commit()
+        for cache_key, source_url, file_id, file_size in self._conn.execute(
+            "SELECT cache_key, source_url, file_id, file_size FROM file_ids"
+        ):
+            self._entries[cache_key] = (source_url, file_id, file_size)
+        logger.info(f"Loaded {len(self._entries)} cached file ids")
+
+    def get(self, cache_key: str, source_url: str) -> Union[tuple, None]:
+        """(file_id, file_size) if this key was uploaded from the same source URL"""
+        entry = self._entries.get(cache_key)
+        if entry is None or entry[0] != source_url:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1], entry[2]
+
+    async def lookup(self, cache_key: str, source_url: str) -> Union[tuple, None]:
+        """get(), falling back to uploads made by other workers"""
+        found = self.get(cache_key, source_url)
+        if found is not None or not state_backend.shared:
+            return found
+        try:
+            value = await state_backend.get(f"file_id:{cache_key}")
+        except Exception as e:
+            logger.error(f"Error reading shared file id: {e}")
+            return None
+        if value is None:
+            return None
+        shared_url, file_id, file_size = json.loads(value)
+        if shared_url != source_url:
+            return None
+        self.shared_hits += 1
+        await self.put(cache_key, source_url, file_id, file_size, share=False)
+        return file_id, file_size
+
+    def _execute(self, sql: str, params: tuple):
+        if self._conn is None:
+            return
+        with self._conn:
+            self._conn.execute(sql, params)
+
+    async def _write(self, sql: str, params: tuple):
+        async with self._write_lock:
+            await asyncio.to_thread(self._execute, sql, params)
+
+    async def put(self, cache_key: str, source_url: str, file_id: str, file_size: int, share: bool = True):
+        self._entries[cache_key] = (source_url, file_id, file_size)
+        try:
+            await self._write(
+                "INSERT OR REPLACE INTO file_ids (cache_key, source_url, file_id, file_size, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cache_key, source_url, file_id, file_size, datetime.now().isoformat())
+            )
+            if share and state_backend.shared:
+                await state_backend.set(f"file_id:{cache_key}", json.dumps([source_url, file_id, file_size]))
+        except Exception as e:
+            logger.error(f"Error saving file id: {e}")
+
+    async def invalidate(self, cache_key: str):
+        self._entries.pop(cache_key, None)
+        try:
+            await self._write("DELETE FROM file_ids WHERE cache_key = ?", (cache_key,))
+            if state_backend.shared:
+                await state_backend.delete(f"file_id:{cache_key}")
+        except Exception as e:
+            logger.error(f"Error removing file id: {e}")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+file_id_cache = FileIdCache(FILE_ID_DB)
+
+def build_file_caption(media: Dict, quality: str, episode_info: Dict, file_size: int) -> str:
+    if episode_info:
+        caption = (
+            f"**📺 {media.get('title', 'N/A')} - S{episode_info['season']}E{episode_info['episode']}**\n"
+            f"**📝 Episode:** {episode_info.get('title', 'N/A')}\n"
+            f"**🎥 Quality:** {quality.upper() if quality else 'Auto'}\n"
+        )
+    else:
+        caption = (
+            f"**🎬 {media.get('title', 'N/A')}**\n"
+            f"**🎥 Quality:** {quality.upper() if quality else 'N/A'}\n"
+        )
+    caption += f"**📁 Size:** {format_file_size(file_size)}\n"
+    caption += (
+        f"**📅 Release:** {media.get('release_date', 'N/A')[:4]}\n"
+        f"**⚠️ This file will be auto-deleted in {AUTO_DELETE_DELAY // 60} minutes**\n\n"
+        "**Created By:** [Zero Creations](https://t.me/zerocreations)"
+    )
+    return caption
+
+async def schedule_file_deletion(client: Client, chat_id: int, sent: Message, status_message_id: int = None):
+    """Auto-delete a delivered file and its status message, as the caption promises"""
+    for message_id in (sent.id if sent else None, status_message_id):
+        if message_id is not None:
+            await auto_delete_message(client, chat_id, message_id)
+
 # Enhanced video sending function
+@traced("send_video_file", slow_after=SLOW_TRANSFER_SECONDS)
 async def send_video_file(client: Client, chat_id: int, video_url: str, media: Dict, quality: str = None, episode_info: Dict = None) -> bool:
     """Actually downloads and sends the video file"""
+    status_msg = None
+    transfer = None
     try:
-        # Create temporary directory
-        os.makedirs(TEMP_DIR, exist_ok=True)
+        # Prepare buttons
+        buttons = InlineKeyboardMarkup([
+            [InlineKeyboardButton("⭐ RATE", callback_data=f"rate_{media['id']}_{quality or 'auto'}")]
+        ])
+        
+        # Re-send an earlier upload of the same file without downloading it again
+        cache_key = FileIdCache.key(media['id'], quality, episode_info)
+        cached = await file_id_cache.lookup(cache_key, video_url)
+        if cached:
+            file_id, file_size = cached
+            try:
+                sent = await client.send_cached_media(
+                    chat_id=chat_id,
+                    file_id=file_id,
+                    caption=build_file_caption(media, quality, episode_info, file_size),
+                    reply_markup=buttons
+                )
+                await schedule_file_deletion(client, chat_id, sent)
+                return True
+            except Exception as e:
+                logger.warning(f"Cached file id for {cache_key} rejected, downloading again: {e}")
+                await file_id_cache.invalidate(cache_key)
         
         # Send initial status message
         status_msg = await client.send_message(
             chat_id=chat_id,
-            text="🚀 Starting download... Please wait"
+            text="🚀 Starting download... Please wait",
+            reply_markup=download_cancel_markup()
         )
         
-        # Generate unique filename
-        file_ext = ".mp4" if "mp4" in video_url.lower() else ".mkv"
-        file_name = f"{media['id']}_{quality}_{datetime.now().timestamp()}{file_ext}"
-        file_path = os.path.join(TEMP_DIR, file_name)
-        
         # Process URL
         processed_url = process_video_url(video_url)
+        
+        while True:
+            transfer = shared_transfers.get(processed_url)
+            if transfer is None and not await download_scheduler.hold_slot():
+                continue  # Waited for a download slot; someone may have started the file meanwhile
+            if transfer is None:
+                # Claim the file here first, so local requests queue behind this one
+                transfer = SharedTransfer(client, processed_url)
+                transfer.subscribe(chat_id, status_msg.id)
+                shared_transfers[processed_url] = transfer
+                lock = DownloadLock(processed_url)
+                leading = False
+                result = SharedTransfer.CANCELLED
+                try:
+                    if await lock.acquire():
+                        leading = True
+                        break
+                    # Another worker is fetching it: relay its outcome to everyone waiting here,
+                    # without holding a download slot that local work could use meanwhile
+                    download_scheduler.release_slot()
+                    await client.edit_message_text(
+                        chat_id=chat_id,
+                        message_id=status_msg.id,
+                        text="🔗 This file is already being downloaded, you'll get it as soon as it's ready...",
+                        reply_markup=download_cancel_markup()
+                    )
+                    result = await lock.wait()
+                finally:
+                    if not leading:
+                        transfer.finish(result)
+                        shared_transfers.pop(processed_url, None)
+            else:
+                # Someone else is already fetching this file: wait for their upload and re-send it
+                download_scheduler.release_slot()
+                transfer.subscribe(chat_id, status_msg.id)
+                await client.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=status_msg.id,
+                    text="🔗 This file is already being downloaded, you'll get it as soon as it's ready...",
+                    reply_markup=download_cancel_markup()
+                )
+                result = await transfer.wait()
+            if result is SharedTransfer.CANCELLED:
+                continue
+            if result is None:
+                await client.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=status_msg.id,
+                    text="❌ Download failed! Please try another quality or link."
+                )
+                return False
+            file_id, file_size = result
+            sent = await client.send_cached_media(
+                chat_id=chat_id,
+                file_id=file_id,
+                caption=build_file_caption(media, quality, episode_info, file_size),
+                reply_markup=buttons
+            )
+            await file_id_cache.put(cache_key, video_url, file_id, file_size)
+            await client.edit_message_text(
+                chat_id=chat_id,
+                message_id=status_msg.id,
+                text="✅ File successfully sent! You'll find it above."
+            )
+            await schedule_file_deletion(client, chat_id, sent, status_msg.id)
+            return True
+        
+        started = time.monotonic()
+        result = None
+        try:
+            result = await _transfer_video_file(
+                client, transfer, chat_id, status_msg.id, video_url, media, quality, episode_info, buttons
+            )
+        except asyncio.CancelledError:
+            transfer.finish(SharedTransfer.CANCELLED)
+            await lock.release(SharedTransfer.CANCELLED)
+            raise
+        finally:
+            transfer.finish(None)
+            shared_transfers.pop(processed_url, None)
+            await lock.release(result)
+            transfer_seconds.observe(time.monotonic() - started)
+            transfer_totals["ok" if result else "failed"] += 1
+            if result:
+                transfer_totals["bytes"] += result[1]
+        
+        if result:
+            await file_id_cache.put(cache_key, video_url, *result)
+        return result is not None
+            
+    except asyncio.CancelledError:
+        if status_msg is not None:
+            if transfer is not None:
+                transfer.unsubscribe(chat_id, status_msg.id)
+            try:
+                await client.edit_message_text(chat_id=chat_id, message_id=status_msg.id, text="❌ Download cancelled.")
+            except Exception:
+                pass
+        raise
+    except Exception as e:
+        logger.error(f"Error in send_video_file: {e}")
+        return False
+
+async def _transfer_video_file(client: Client, transfer: "SharedTransfer", chat_id: int, status_message_id: int,
+                               video_url: str, media: Dict, quality: str, episode_info: Dict,
+                               buttons: InlineKeyboardMarkup) -> Union[tuple, None]:
+    """Download transfer.url once and upload it to chat_id, returning (file_id, size) for everyone waiting"""
+    processed_url = transfer.url
+    state = None
+    partial = False  # Whether state.file_path is an unfinished download of ours, not a cached copy
+    try:
+        # Create temporary directory
+        os.makedirs(TEMP_DIR, exist_ok=True)
+        
+        # Stable filename per source, so an interrupted download can resume
+        file_ext = ".mp4" if "mp4" in video_url.lower() else ".mkv"
+        url_hash = md5(processed_url.encode()).hexdigest()[:12]
+        file_name = f"{media['id']}_{quality}_{url_hash}{file_ext}"
+        file_path = os.path.join(TEMP_DIR, file_name)
         logger.info(f"Downloading from: {processed_url}")
         
+        # Remember the job next to the partial file in case the bot restarts mid-download
+        state = DownloadState(file_path)
+        if state.load(processed_url):
+            logger.info(f"Resuming partial download {file_name}")
+        else:
+            state.data = {}
+        state.data.pop("failed", None)
+        state.data["job"] = {
+            "chat_id": chat_id,
+            "video_url": video_url,
+            "media": {key: media.get(key) for key in ("id", "title", "release_date")},
+            "quality": quality,
+            "episode_info": episode_info,
+        }
+        
+        # A copy kept from an earlier download is sent straight from disk
+        download_success = None
+        cached_path = video_cache.get(processed_url)
+        partial = not cached_path
+        if cached_path:
+            logger.info(f"Sending cached copy {os.path.basename(cached_path)}")
+            file_path = cached_path
+            download_success = True
+        
+        # Large files on range-capable hosts download over several connections
+        if download_success is None and PARALLEL_DOWNLOADS:
+            source = await probe_source(processed_url)
+            if source["ranges"] and source["size"] >= PARALLEL_MIN_SIZE:
+                with span("download"):
+                    download_success = await SegmentedDownload(
+                        processed_url, file_path, source["size"], source["validator"],
+                        transfer.progress, state
+                    ).run()
+        
+        # Otherwise stream straight into the upload when the source announces its size,
+        # unless there is a partial copy on disk to resume
+        if download_success is None and STREAM_UPLOADS and not state.data.get("mode"):
+            try:
+                # Download and upload overlap here; the upload is the slower side
+                with span("upload"):
+                    streamed = await stream_document(
+                        client, processed_url, file_name, chat_id, transfer.progress,
+                        lambda size: build_file_caption(media, quality, episode_info, size),
+                        buttons
+                    )
+            except Exception as e:
+                logger.error(f"Streaming upload error: {e}")
+                await client.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=status_message_id,
+                    text=f"❌ Failed to send file: {str(e)}"
+                )
+                return None
+            if streamed:
+                sent, file_size = streamed
+                await client.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=status_message_id,
+                    text="✅ File successfully sent! You'll find it above."
+                )
+                await schedule_file_deletion(client, chat_id, sent, status_message_id)
+                return transfer.finish((sent.document.file_id, file_size) if sent and sent.document else None)
+        
         # Download file with progress
-        download_success = await download_file_with_progress(
-            processed_url, file_path, client, chat_id, status_msg.id
-        )
+        if download_success is None:
+            with span("download"):
+                download_success = await download_file_with_progress(
+                    processed_url, file_path, transfer.progress, state
+                )
+        
+        # Partial files and their state are kept on failure so an immediate retry resumes (until the next cache sweep)
+        if download_success and not cached_path:
+            state.remove()
+            partial = False
+            await video_cache.put(processed_url, file_path)
         
         if not download_success:
+            await state.mark_failed()
             await client.edit_message_text(
                 chat_id=chat_id,
-                message_id=status_msg.id,
+                message_id=status_message_id,
                 text="❌ Download failed! Please try another quality or link."
             )
-            return False
+            return None
         
         # Prepare caption
-        if episode_info:
-            caption = (
-                f"**📺 {media.get('title', 'N/A')} - S{episode_info['season']}E{episode_info['episode']}**\n"
-                f"**📝 Episode:** {episode_info.get('title', 'N/A')}\n"
-                f"**🎥 Quality:** {quality.upper() if quality else 'Auto'}\n"
-            )
-        else:
-            caption = (
-                f"**🎬 {media.get('title', 'N/A')}**\n"
-                f"**🎥 Quality:** {quality.upper() if quality else 'N/A'}\n"
-            )
-        
-        # Get file size
         file_size = os.path.getsize(file_path)
-        caption += f"**📁 Size:** {format_file_size(file_size)}\n"
-        caption += (
-            f"**📅 Release:** {media.get('release_date', 'N/A')[:4]}\n"
-            "**⚠️ This file will be auto-deleted in 15 minutes**\n\n"
-            "**Created By:** [Zero Creations](https://t.me/zerocreations)"
-        )
-        
-        # Prepare buttons
-        buttons = InlineKeyboardMarkup([
-            [InlineKeyboardButton("⭐ RATE", callback_data=f"rate_{media['id']}_{quality or 'auto'}")]
-        ])
+        caption = build_file_caption(media, quality, episode_info, file_size)
         
         # Send the actual file
         try:
-            # Send as document for best compatibility
-            await client.send_document(
-                chat_id=chat_id,
-                document=file_path,
-                caption=caption,
-                reply_markup=buttons
-            )
-            
-            # Update status message
-            await client.edit_message_text(
-                chat_id=chat_id,
-                message_id=status_msg.id,
-                text="✅ File successfully sent! You'll find it above."
-            )
-            
-            # Schedule file cleanup
-            asyncio.create_task(cleanup_file(file_path))
-            return True
-        except Exception as e:
-            logger.error(f"File sending error: {e}")
-            await client.edit_message_text(
-                chat_id=chat_id,
-                message_id=status_msg.id,
-                text=f"❌ Failed to send file: {str(e)}"
-            )
-            return False
-            
-    except Exception as e:
-        logger.error(f"Error in send_video_file: {e}")
-        return False
+            # Send as document for best compatibility
+            with span("upload"):
+                sent = await client.send_document(
+                    chat_id=chat_id,
+                    document=file_path,
+                    caption=caption,
+                    reply_markup=buttons
+                )
+            
+            # Update status message
+            await client.edit_message_text(
+                chat_id=chat_id,
+                message_id=status_message_id,
+                text="✅ File successfully sent! You'll find it above."
+            )
+            await schedule_file_deletion(client, chat_id, sent, status_message_id)
+            return transfer.finish((sent.document.file_id, file_size) if sent and sent.document else None)
+        except Exception as e:
+            logger.error(f"File sending error: {e}")
+            await client.edit_message_text(
+                chat_id=chat_id,
+                message_id=status_message_id,
+                text=f"❌ Failed to send file: {str(e)}"
+            )
+            return None
+    
+    except asyncio.CancelledError:
+        # Cancelled by the user: drop the partial download instead of resuming it later
+        if state is not None:
+            state.remove()
+            if partial and os.path.exists(state.file_path):
+                os.remove(state.file_path)
+        raise
+    except Exception:
+        if state is not None:
+            await state.mark_failed()
+        raise
+
+# Download scheduler
+current_download_job = contextvars.ContextVar("current_download_job", default=None)
+
+def download_cancel_markup(job_id: int = None) -> Union[InlineKeyboardMarkup, None]:
+    """Cancel button for job_id, or the download job running in the current task, if any"""
+    if job_id is None:
+        job_id = current_download_job.get()
+    if job_id is None:
+        return None
+    return InlineKeyboardMarkup([[InlineKeyboardButton("❌ CANCEL", callback_data=f"cancel_download_{job_id}")]])
+
+class DownloadJob:
+    __slots__ = ("job_id", "user_id", "priority", "seq", "func", "enqueued_at", "key", "counted", "waiter",
+                 "task", "client", "queue_message_id", "position", "position_updated")
+
+    def __init__(self, job_id: int, user_id: int, priority: int, func, client: Client, key: str = None):
+        self.job_id = job_id
+        self.key = key
+        self.counted = True
+        self.waiter = None  # Future of a running job queued again for a slot, see hold_slot()
+        self.user_id = user_id
+        self.priority = priority
+        self.seq = job_id
+        self.func = func
+        self.client = client
+        self.enqueued_at = time.monotonic()
+        self.task = None
+        self.queue_message_id = None
+        self.position = None
+        self.position_updated = 0.0
+
+class DownloadScheduler:
+    """Runs download jobs in the background under global and per-user limits.
+
+    Waiting jobs form a priority queue (premium users first, then arrival
+    order). Their owners see their position in the queue and can cancel.
+    """
+
+    PRIORITY_PREMIUM = 0
+    PRIORITY_DEFAULT = 1
+    POSITION_UPDATE_INTERVAL = 15
+
+    def __init__(self, max_concurrent: int, per_user: int, queued_per_user: int):
+        self.max_concurrent = max_concurrent
+        self.per_user = per_user
+        self.queued_per_user = queued_per_user
+        self.jobs = {}      # job id -> DownloadJob (queued or running)
+        self._queue = []    # DownloadJobs waiting, kept in priority order
+        self._running = {}  # user id -> running job count
+        self._next_id = 1
+        self.active = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.started = 0
+
+    def _queued_for(self, user_id: int) -> int:
+        return sum(1 for job in self._queue if job.user_id == user_id and job.waiter is None)
+
+    async def submit(self, client: Client, user_id: int, func, key: str = None) -> bool:
+        """Queue func() (a coroutine function) for user_id; False if the user's queue is full.
+
+        `key` is the processed source URL. While a transfer of that URL is in
+        flight the job starts at once without using a slot, since it only
+        waits for the shared upload; should it end up downloading the file
+        itself, hold_slot() makes it wait for a slot first.
+        """
+        if self._queued_for(user_id) >= self.queued_per_user:
+            self.rejected += 1
+            await client.send_message(user_id, "**⚠️ You already have downloads waiting. Please wait for them to finish.**")
+            return False
+
+        priority = self.PRIORITY_PREMIUM if user_id in PREMIUM_USERS or user_id == ADMIN_ID else self.PRIORITY_DEFAULT
+        job = DownloadJob(self._next_id, user_id, priority, func, client, key)
+        self._next_id += 1
+        self.jobs[job.job_id] = job
+        self._queue.append(job)
+        self._queue.sort(key=lambda queued: (queued.priority, queued.seq))
+        self._dispatch()
+
+        if job.task is None:
+            position = self._queue.index(job) + 1
+            try:
+                message = await client.send_message(
+                    user_id,
+                    self._position_text(position),
+                    reply_markup=InlineKeyboardMarkup([
+                        [InlineKeyboardButton("❌ CANCEL", callback_data=f"cancel_download_{job.job_id}")]
+                    ])
+                )
+                job.queue_message_id = message.id
+                job.position = position
+                job.position_updated = time.monotonic()
+            except Exception as e:
+                logger.error(f"Error sending queue position: {e}")
+        return True
+
+    @staticmethod
+    def _position_text(position: int) -> str:
+        return (
+            f"**⏳ Your download is queued.**\n\n"
+            f"**📍 Position in queue:** {position}\n"
+            "**💎 Premium users get priority:** /plan"
+        )
+
+    def _dispatch(self):
+        """Start every waiting job that fits under the limits, then refresh queue positions"""
+        for job in list(self._queue):
+            attach = job.key in shared_transfers and job.waiter is None
+            if not attach and (self.active >= self.max_concurrent or self._running.get(job.user_id, 0) >= self.per_user):
+                continue
+            job.counted = not attach
+            self._queue.remove(job)
+            self._start(job)
+
+        now = time.monotonic()
+        for position, job in enumerate(self._queue, start=1):
+            if (
+                job.queue_message_id and job.position != position
+                and (position <= 3 or now - job.position_updated >= self.POSITION_UPDATE_INTERVAL)
+            ):
+                job.position = position
+                job.position_updated = now
+                asyncio.create_task(self._edit_queue_message(job, self._position_text(position), True))
+
+    async def _edit_queue_message(self, job: DownloadJob, text: str, cancellable: bool):
+        try:
+            with background_calls():
+                await job.client.edit_message_text(
+                    chat_id=job.user_id,
+                    message_id=job.queue_message_id,
+                    text=text,
+                    reply_markup=InlineKeyboardMarkup([
+                        [InlineKeyboardButton("❌ CANCEL", callback_data=f"cancel_download_{job.job_id}")]
+                    ]) if cancellable else None
+                )
+        except Exception as e:
+            logger.debug(f"Queue position update failed for job {job.job_id}: {e}")
+
+    def _start(self, job: DownloadJob):
+        if job.counted:
+            self.active += 1
+            self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+        if job.waiter is not None:
+            # Already running: just hand it the slot (a cancelled waiter gives it back in _run)
+            if not job.waiter.done():
+                job.waiter.set_result(None)
+            return
+        wait = time.monotonic() - job.enqueued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.started += 1
+        if job.queue_message_id:
+            asyncio.create_task(self._edit_queue_message(job, "**🚀 Your download is starting...**", False))
+        job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: DownloadJob):
+        current_download_job.set(job.job_id)
+        try:
+            await job.func()
+            self.completed += 1
+        except asyncio.CancelledError:
+            self.cancelled += 1
+        except Exception as e:
+            logger.error(f"Download job {job.job_id} failed: {e}")
+        finally:
+            self._uncount(job)
+            self.jobs.pop(job.job_id, None)
+            self._dispatch()
+
+    def _uncount(self, job: DownloadJob):
+        if job.counted:
+            job.counted = False
+            self.active -= 1
+            self._running[job.user_id] -= 1
+            if not self._running[job.user_id]:
+                del self._running[job.user_id]
+
+    def release_slot(self):
+        """Stop counting the current job against the limits while it only waits for another download"""
+        job = self.jobs.get(current_download_job.get())
+        if job is not None and job.counted:
+            self._uncount(job)
+            self._dispatch()
+
+    async def hold_slot(self) -> bool:
+        """Make sure the current job counts against the limits before it downloads anything.
+
+        True when it already does, or runs outside the scheduler. A job that
+        started without a slot to join a transfer queues again and gets False
+        once it has one, so the caller can look for a transfer to join again.
+        """
+        job = self.jobs.get(current_download_job.get())
+        if job is None or job.counted:
+            return True
+        job.waiter = asyncio.get_running_loop().create_future()
+        self._queue.append(job)
+        self._queue.sort(key=lambda queued: (queued.priority, queued.seq))
+        self._dispatch()
+        try:
+            await job.waiter
+        finally:
+            if job in self._queue:
+                self._queue.remove(job)
+            job.waiter = None
+        return False
+
+    async def cancel(self, job_id: int, user_id: int) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return False
+        if job.task is None:
+            self._queue.remove(job)
+            self.jobs.pop(job_id, None)
+            self.cancelled += 1
+            if job.queue_message_id:
+                await self._edit_queue_message(job, "**❌ Download cancelled.**", False)
+            self._dispatch()
+        else:
+            job.task.cancel()
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": len(self._queue),
+            "active": self.active,
+            "started": self.started,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "avg_wait": self.total_wait / self.started if self.started else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+download_scheduler = DownloadScheduler(MAX_CONCURRENT_DOWNLOADS, MAX_DOWNLOADS_PER_USER, MAX_QUEUED_PER_USER)
+
+# Helper functions
+def format_file_size(size_bytes: int) -> str:
+    """Convert bytes to human readable format"""
+    if size_bytes == 0:
+        return "Unknown"
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size_bytes < 1024.0:
+            return f"{size_bytes:.1f} {unit}"
+        size_bytes /= 1024.0
+    return f"{size_bytes:.1f} TB"
+
+def format_eta(remaining_bytes: int, speed_kb: float) -> str:
+    """Format estimated time remaining"""
+    if speed_kb <= 0:
+        return "Calculating..."
+    seconds = remaining_bytes / (speed_kb * 1024)
+    return str(timedelta(seconds=int(seconds)))
+
+async def resume_interrupted_downloads(client: Client):
+    """Finish and deliver downloads that were cut short by a restart"""
+    for entry in os.listdir(TEMP_DIR):
+        if not entry.endswith(DownloadState.SUFFIX):
+            continue
+        state_path = os.path.join(TEMP_DIR, entry)
+        file_path = state_path[:-len(DownloadState.SUFFIX)]
+        try:
+            with open(state_path, 'r') as f:
+                data = json.load(f)
+            job = data.get("job")
+            if not job or time.time() - data.get("updated_at", 0) > RESUME_MAX_AGE or not os.path.exists(file_path):
+                raise ValueError("stale or incomplete download state")
+        except Exception as e:
+            logger.info(f"Discarding partial download {entry}: {e}")
+            for path in (state_path, file_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            continue
+        if data.get("failed"):
+            # The user was already told it failed; the cache sweep clears its partial file
+            continue
+        logger.info(f"Resuming interrupted download for chat {job['chat_id']}: {os.path.basename(file_path)}")
+        await download_scheduler.submit(
+            client, job["chat_id"],
+            lambda job=job: send_video_file(
+                client, job["chat_id"], job["video_url"], job["media"], job["quality"], job["episode_info"]
+            ),
+            key=data.get("url")
+        )
+
+def get_greeting():
+    """Get greeting based on current time"""
+    current_hour = datetime.now().hour
+    if 5 <= current_hour < 12:
+        return "ɢᴏᴏᴅ ᴍᴏʀɴɪɴɢ 🌞"
+    elif 12 <= current_hour < 17:
+        return "ɢᴏᴏᴅ ᴀғᴛᴇʀɴᴏᴏɴ ☀️"
+    elif 17 <= current_hour < 21:
+        return "ɢᴏᴏᴅ ᴇᴠᴇɴɪɴɢ 🌅"
+    else:
+        return "ɢᴏᴏᴅ ɴɪɢʜᴛ 🌙"
+
+# Health and metrics server
+search_latency = Histogram((0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+transfer_seconds = Histogram((1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+transfer_totals = {"ok": 0, "failed": 0, "bytes": 0}
+
+class LoopMonitor:
+    """Measures how late a periodic wake-up fires, i.e. how busy the event loop is"""
+
+    LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+    HISTORY_SECONDS = 600
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.last_beat = time.monotonic()
+        self.histogram = Histogram(self.LAG_BUCKETS)
+        self.recent = deque(maxlen=max(int(self.HISTORY_SECONDS / interval), 1))  # (beat time, lag)
+        self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(now - expected, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+            self.last_beat = now
+            self.histogram.observe(self.lag)
+            self.recent.append((now, self.lag))
+
+    def current_lag(self) -> float:
+        """Lag of the last beat, or how overdue the next one is if the loop is stuck"""
+        return max(self.lag, time.monotonic() - self.last_beat - self.interval)
+
+    def peak_since(self, since: float) -> float:
+        """Worst lag seen by beats after `since` (a time.monotonic() value)"""
+        peak = self.current_lag() if self._task else 0.0
+        for beat, lag in reversed(self.recent):
+            if beat < since:
+                break
+            peak = max(peak, lag)
+        return peak
+
+    def start(self):
+        self.last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+loop_monitor = LoopMonitor(LOOP_MONITOR_INTERVAL)
+process_started = time.monotonic()
+
+def health_problems() -> List[str]:
+    """Reasons the bot is not healthy; empty when it is"""
+    problems = []
+    lag = loop_monitor.current_lag()
+    if lag > HEALTH_MAX_LOOP_LAG:
+        problems.append(f"event loop lagging {lag:.1f}s")
+    if catalog_cache.loaded_at:
+        age = time.monotonic() - catalog_cache.loaded_at
+        if age > HEALTH_CATALOG_MAX_AGE:
+            problems.append(f"catalog is {age:.0f}s old")
+    elif time.monotonic() - process_started > HEALTH_STARTUP_GRACE:
+        problems.append("catalog never loaded")
+    return problems
+
+async def handle_health(request: web.Request) -> web.Response:
+    problems = health_problems()
+    if problems:
+        return web.Response(status=503, text="\n".join(problems))
+    return web.Response(text="OK")
+
+async def handle_ready(request: web.Request) -> web.Response:
+    if not app.is_connected or catalog_cache.catalog is None:
+        return web.Response(status=503, text="starting")
+    return web.Response(text="READY")
+
+def _metric(lines: List[str], name: str, kind: str, help_text: str, samples: Dict):
+    """Append one metric family; samples maps a label string ('' for none) to a value"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples.items():
+        lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+def render_metrics() -> str:
+    lines = []
+    lines += search_latency.render("filmzi_search_seconds", "Time spent searching the catalog")
+    lines += transfer_seconds.render("filmzi_transfer_seconds", "Time to download and deliver a file")
+    for name, label, histograms, help_text in (
+        ("filmzi_handler_seconds", "handler", handler_latency, "Handler latency by handler"),
+        ("filmzi_span_seconds", "span", span_latency, "Time spent in each kind of span"),
+    ):
+        if histograms:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for key, histogram in sorted(histograms.items()):
+                lines += histogram.samples(name, f'{label}="{key}"')
+    _metric(lines, "filmzi_transfers_total", "counter", "Finished file transfers by result",
+            {'result="ok"': transfer_totals["ok"], 'result="failed"': transfer_totals["failed"]})
+    _metric(lines, "filmzi_transfer_bytes_total", "counter", "Bytes delivered by file transfers",
+            {"": transfer_totals["bytes"]})
+    _metric(lines, "filmzi_active_transfers", "gauge", "Transfers in flight", {"": len(shared_transfers)})
+
+    media = media_cache.stats()
+    videos = video_cache.stats()
+    _metric(lines, "filmzi_cache_hits_total", "counter", "Cache hits by cache", {
+        'cache="media"': media["hits"],
+        'cache="membership"': membership_cache.hits,
+        'cache="file_id"': file_id_cache.hits,
+        'cache="video"': videos["hits"],
+    })
+    _metric(lines, "filmzi_cache_misses_total", "counter", "Cache misses by cache", {
+        'cache="media"': media["misses"],
+        'cache="membership"': membership_cache.misses,
+        'cache="file_id"': file_id_cache.misses,
+        'cache="video"': videos["misses"],
+    })
+    _metric(lines, "filmzi_video_cache_bytes", "gauge", "Bytes of downloaded videos kept on disk", {"": videos["bytes"]})
+    _metric(lines, "filmzi_catalog_titles", "gauge", "Titles in the cached catalog", {"": len(catalog_cache.catalog or ())})
+    _metric(lines, "filmzi_catalog_age_seconds", "gauge", "Seconds since the catalog was refreshed",
+            {"": time.monotonic() - catalog_cache.loaded_at if catalog_cache.loaded_at else -1})
+
+    queue = download_scheduler.stats()
+    _metric(lines, "filmzi_download_queue_depth", "gauge", "Downloads waiting for a slot", {"": queue["queue_depth"]})
+    _metric(lines, "filmzi_downloads_running", "gauge", "Downloads holding a slot", {"": queue["active"]})
+    _metric(lines, "filmzi_download_jobs_total", "counter", "Download jobs by outcome", {
+        'outcome="started"': queue["started"],
+        'outcome="completed"': queue["completed"],
+        'outcome="cancelled"': queue["cancelled"],
+        'outcome="rejected"': queue["rejected"],
+    })
+
+    api = telegram_limiter.stats()
+    _metric(lines, "filmzi_telegram_calls_total", "counter", "Telegram API calls made", {"": api["calls"]})
+    _metric(lines, "filmzi_telegram_throttled_total", "counter", "Calls delayed by the rate limiter", {"": api["throttled"]})
+    _metric(lines, "filmzi_telegram_flood_waits_total", "counter", "FloodWait errors received", {"": api["flood_waits"]})
+    _metric(lines, "filmzi_telegram_retries_total", "counter", "Calls retried after a FloodWait", {"": api["retried"]})
+    _metric(lines, "filmzi_telegram_failures_total", "counter", "Calls that raised", {"": api["failed"]})
+
+    sessions = search_sessions.stats()
+    _metric(lines, "filmzi_search_sessions", "gauge", "Stored search sessions", {"": sessions["sessions"]})
+    _metric(lines, "filmzi_pending_deletions", "gauge", "Messages waiting to be auto-deleted",
+            {"": deletion_scheduler.stats()["pending"]})
+    _metric(lines, "filmzi_event_loop_lag_seconds", "gauge", "Delay of the event loop heartbeat",
+            {"": loop_monitor.current_lag()})
+    lines += loop_monitor.histogram.render("filmzi_event_loop_heartbeat_lag_seconds", "Delay of each event loop heartbeat")
+    lines += catalog_cache.rebuild_seconds.render("filmzi_catalog_rebuild_seconds", "Time to decode and index a new catalog")
+    _metric(lines, "filmzi_catalog_rebuild_loop_lag_seconds", "gauge",
+            "Worst event loop lag seen during the last catalog rebuild", {"": catalog_cache.rebuild_loop_lag})
+    pool = search_pool.stats()
+    _metric(lines, "filmzi_search_workers_ready", "gauge", "Search worker processes holding an index", {"": pool["ready"]})
+    _metric(lines, "filmzi_search_fallbacks_total", "counter", "Searches run in-process because no worker was ready",
+            {"": pool["fallbacks"]})
+    return "\n".join(lines) + "\n"
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        body=render_metrics().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+async def start_health_server() -> web.AppRunner:
+    """Serve /health, /ready and /metrics on the bot's event loop"""
+    server = web.Application()
+    server.add_routes([
+        web.get("/health", handle_health),
+        web.get("/ready", handle_ready),
+        web.get("/metrics", handle_metrics),
+    ])
+    runner = web.AppRunner(server, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", PORT).start()
+    logger.info(f"Health check server running on port {PORT}")
+    return runner
+
+# Metadata API client
+class MediaAPIClient:
+    """Shared keep-alive HTTP client for the metadata API"""
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=API_POOL_SIZE,
+                limit_per_host=API_POOL_PER_HOST,
+                ttl_dns_cache=300,
+                keepalive_timeout=60
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=API_CONNECT_TIMEOUT,
+                sock_read=API_READ_TIMEOUT
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def get_json(self, path: str, headers: Dict = None, parse: bool = True) -> tuple:
+        """GET a JSON resource, returning (status, response headers, parsed body or None).
+
+        With parse=False the body comes back as raw bytes, for callers that decode it themselves.
+        """
+        url = f"{self.base_url}{path}"
+        for attempt in range(API_MAX_RETRIES + 1):
+            try:
+                async with self._get_session().get(url, headers=headers) as response:
+                    if response.status in self.RETRY_STATUSES and attempt < API_MAX_RETRIES:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=response.status
+                        )
+                    data = None
+                    if response.status == 200:
+                        data = await response.json(content_type=None) if parse else await response.read()
+                    return response.status, response.headers, data
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= API_MAX_RETRIES:
+                    raise
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+                logger.warning(f"API request to {path} failed ({e!r}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+media_api = MediaAPIClient(BASE_URL)
+
+# Catalog cache
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+class Catalog:
+    """Columnar, read-only copy of the media catalog.
+
+    The fields search and result lists need (id, normalized title, keywords and
+    alternative titles, year, type, rating) live in parallel arrays and lists of
+    interned strings. Everything else - descriptions, seasons, video links - stays
+    as each title's compact JSON (zlib-compressed unless compress_level is 0) in
+    one blob and is decoded by details() on demand.
+    """
+
+    def __init__(self, compress_level: int = CATALOG_COMPRESS_LEVEL):
+        self.compress_level = compress_level
+        self.ids = array('q')
+        self.titles = []          # Lowercased titles, interned
+        self.phrases = []         # Lowercased keywords and alternative titles, as tuples of interned strings
+        self.years = array('H')   # 0 when the release date has no year
+        self.types = array('H')   # Index into type_names
+        self.ratings = array('d')  # Clamped to 0-10
+        self.type_names = []
+        self._type_codes = {}
+        self._blob = bytearray()
+        self._offsets = array('Q', [0])  # Title i's JSON is blob[offsets[i]:offsets[i + 1]]
+        self._sorted_ids = array('q')
+        self._order = array('L')
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _add(self, item: Dict, raw: bytes = None):
+        try:
+            media_id = int(item["id"])
+        except (KeyError, TypeError, ValueError):
+            return
+        self.ids.append(media_id)
+        self.titles.append(sys.intern((item.get('title') or '').lower()))
+        phrases = []
+        for field in ('keywords', 'alternative_titles'):
+            if item.get(field):
+                phrases.extend(sys.intern(phrase.lower()) for phrase in item[field])
+        self.phrases.append(tuple(phrases) if phrases else ())
+        year = (item.get('release_date') or '')[:4]
+        self.years.append(int(year) if year.isdigit() else 0)
+        media_type = item.get('type') or ''
+        code = self._type_codes.get(media_type)
+        if code is None:
+            code = self._type_codes[media_type] = len(self.type_names)
+            self.type_names.append(sys.intern(media_type))
+        self.types.append(code)
+        try:
+            rating = min(max(float(item.get('rating') or 0), 0.0), 10.0)
+        except (TypeError, ValueError):
+            rating = 0.0
+        self.ratings.append(rating)
+        if raw is not None:
+            self._blob += zlib.compress(raw, self.compress_level) if self.compress_level else raw
+            self._offsets.append(len(self._blob))
+
+    def _finish(self) -> "Catalog":
+        self._blob = bytes(self._blob)
+        # Stable sort, so with duplicate ids the last one wins as it did in a dict
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        self._order = array('L', order)
+        self._sorted_ids = array('q', (self.ids[position] for position in order))
+        return self
+
+    @classmethod
+    def from_media(cls, items: List[Dict], details: bool = True) -> "Catalog":
+        """Build from decoded titles; details=False keeps only the search fields"""
+        catalog = cls()
+        for item in items:
+            if isinstance(item, dict):
+                raw = json.dumps(item, separators=(",", ":")).encode() if details else None
+                catalog._add(item, raw)
+        return catalog._finish()
+
+    @classmethod
+    async def decode(cls, body: bytes) -> Union["Catalog", None]:
+        """Build from the API's JSON array, yielding to the event loop every CATALOG_DECODE_SLICE seconds.
+
+        Each title is decoded on its own, its search fields copied out and its
+        JSON text kept, so the full dicts never pile up and a large refresh
+        does not stall every other update for the whole parse.
+        Returns None when the payload is not an array.
+        """
+        text = body.decode("utf-8-sig") if isinstance(body, bytes) else body
+        decoder = json.JSONDecoder()
+        catalog = cls()
+        position = JSON_WHITESPACE.match(text).end()
+        if not text.startswith("[", position):
+            return None
+        position = JSON_WHITESPACE.match(text, position + 1).end()
+        slice_ends = time.perf_counter() + CATALOG_DECODE_SLICE
+        while not text.startswith("]", position):
+            item, end = decoder.raw_decode(text, position)
+            if isinstance(item, dict):
+                catalog._add(item, text[position:end].encode())
+            position = JSON_WHITESPACE.match(text, end).end()
+            if text.startswith(",", position):
+                position = JSON_WHITESPACE.match(text, position + 1).end()
+            elif not text.startswith("]", position):
+                raise ValueError(f"Malformed catalog at character {position}")
+            if time.perf_counter() >= slice_ends:
+                await asyncio.sleep(0)
+                slice_ends = time.perf_counter() + CATALOG_DECODE_SLICE
+        return catalog._finish()
+
+    def position(self, media_id: int) -> Union[int, None]:
+        index = bisect_right(self._sorted_ids, media_id) - 1
+        if index < 0 or self._sorted_ids[index] != media_id:
+            return None
+        return self._order[index]
+
+    def media_type(self, position: int) -> str:
+        return self.type_names[self.types[position]]
+
+    def details(self, media_id: int) -> Union[Dict, None]:
+        """The title's full JSON object, decoded on each call (MediaCache keeps the hot ones)"""
+        position = self.position(media_id)
+        if position is None or len(self._offsets) <= position + 1:
+            return None
+        raw = self._blob[self._offsets[position]:self._offsets[position + 1]]
+        return json.loads(zlib.decompress(raw) if self.compress_level else raw)
+
+def write_catalog_snapshot(path: str, body: bytes):
+    """Atomically replace the raw catalog the search workers index"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(body)
+    os.replace(temp_path, path)
+
+class CatalogCache:
+    """Process-wide copy of the media catalog, refreshed in the background"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.catalog = None
+        self.index = None
+        self.etag = None
+        self.last_modified = None
+        self.loaded_at = 0.0
+        self.version = 0
+        self.rebuild_seconds = Histogram(SPAN_BUCKETS)
+        self.rebuild_loop_lag = 0.0
+        self._lock = asyncio.Lock()
+        self._index_task = None  # Fallback SearchIndex being built, see local_index()
+        self._refresh_task = None
+        self._loop_task = None
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.loaded_at >= self.ttl
+
+    async def refresh(self) -> bool:
+        """Fetch the catalog, sending validators so an unchanged catalog costs a 304"""
+        async with self._lock:
+            headers = {}
+            if self.catalog is not None:
+                if self.etag:
+                    headers["If-None-Match"] = self.etag
+                if self.last_modified:
+                    headers["If-Modified-Since"] = self.last_modified
+            try:
+                status, response_headers, body = await media_api.get_json(MEDIA_ENDPOINT, headers, parse=False)
+                if status == 304 and self.catalog is not None:
+                    self.loaded_at = time.monotonic()
+                    return True
+                if status != 200:
+                    logger.error(f"Catalog refresh failed with status {status}")
+                    return False
+                started = time.monotonic()
+                catalog = await Catalog.decode(body)
+                if catalog is None:
+                    logger.error("Catalog refresh returned an unexpected payload")
+                    return False
+                # Index in the search workers when there are any; the in-process index blocks the loop
+                self.index = None if search_pool.enabled else SearchIndex(catalog)
+                self._index_task = None
+                self.catalog = catalog
+                media_cache.clear()
+                self.etag = response_headers.get("ETag")
+                self.last_modified = response_headers.get("Last-Modified")
+                self.loaded_at = time.monotonic()
+                self.version += 1
+                if search_pool.enabled:
+                    await asyncio.to_thread(write_catalog_snapshot, CATALOG_SNAPSHOT, body)
+                    await search_pool.load(CATALOG_SNAPSHOT, self.version)
+                self.rebuild_seconds.observe(time.monotonic() - started)
+                self.rebuild_loop_lag = loop_monitor.peak_since(started)
+                logger.info(
+                    f"Catalog loaded: {len(catalog)} titles (version {self.version}) in "
+                    f"{time.monotonic() - started:.2f}s, worst loop lag {self.rebuild_loop_lag * 1000:.0f} ms"
+                )
+                return True
+            except Exception as e:
+                logger.error(f"Error refreshing catalog: {e}")
+                return False
+
+    async def get(self) -> Union[Catalog, None]:
+        """Return the last good catalog, revalidating in the background when stale"""
+        if self.catalog is None:
+            await self.refresh()
+        elif self.is_stale():
+            self._schedule_refresh()
+        return self.catalog
+
+    async def local_index(self) -> Union["SearchIndex", None]:
+        """The in-process index for when the search workers cannot answer.
+
+        It is built on first use in a thread, shared by every search waiting
+        for it, so a missing worker doesn't stall the event loop for the build.
+        """
+        if self.index is not None or self.catalog is None:
+            return self.index
+        if self._index_task is None:
+            self._index_task = asyncio.ensure_future(asyncio.to_thread(SearchIndex, self.catalog))
+        task = self._index_task
+        try:
+            index = await asyncio.shield(task)
+        except Exception:
+            if task is self._index_task:
+                self._index_task = None  # Let the next search try again
+            raise
+        if index.catalog is self.catalog:
+            self.index = index
+        return index
 
-# Helper functions
-def format_file_size(size_bytes: int) -> str:
-    """Convert bytes to human readable format"""
-    if size_bytes == 0:
-        return "Unknown"
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size_bytes < 1024.0:
-            return f"{size_bytes:.1f} {unit}"
-        size_bytes /= 1024.0
-    return f"{size_bytes:.1f} TB"
+    def _schedule_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
 
-def format_eta(remaining_bytes: int, speed_kb: float) -> str:
-    """Format estimated time remaining"""
-    if speed_kb <= 0:
-        return "Calculating..."
-    seconds = remaining_bytes / (speed_kb * 1024)
-    return str(timedelta(seconds=int(seconds)))
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.ttl)
+            await self.refresh()
 
-async def cleanup_file(file_path: str):
-    """Delete temporary file after delay"""
-    try:
-        # Wait 15 minutes before cleanup
-        await asyncio.sleep(900)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info(f"Cleaned up file: {file_path}")
-    except Exception as e:
-        logger.error(f"File cleanup error: {e}")
+    async def start(self):
+        """Load the catalog once and keep it fresh until stop() is called"""
+        await self.refresh()
+        self._loop_task = asyncio.create_task(self._refresh_loop())
 
-def get_greeting():
-    """Get greeting based on current time"""
-    current_hour = datetime.now().hour
-    if 5 <= current_hour < 12:
-        return "ɢᴏᴏᴅ ᴍᴏʀɴɪɴɢ 🌞"
-    elif 12 <= current_hour < 17:
-        return "ɢᴏᴏᴅ ᴀғᴛᴇʀɴᴏᴏɴ ☀️"
-    elif 17 <= current_hour < 21:
-        return "ɢᴏᴏᴅ ᴇᴠᴇɴɪɴɢ 🌅"
-    else:
-        return "ɢᴏᴏᴅ ɴɪɢʜᴛ 🌙"
+    async def stop(self):
+        for task in (self._loop_task, self._refresh_task):
+            if task and not task.done():
+                task.cancel()
 
-def start_health_server():
-    """Start a simple HTTP server for health checks"""
-    server = HTTPServer(('0.0.0.0', PORT), HealthCheckHandler)
-    logger.info(f"Health check server running on port {PORT}")
-    server.serve_forever()
-
-# Health check handler
-class HealthCheckHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b'OK')
+catalog_cache = CatalogCache(CATALOG_TTL)
+
+# Per-media cache
+class MediaCache:
+    """LRU + TTL cache of media details by id, with single-flight upstream fetches"""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # media id -> (expires_at, media)
+        self._inflight = {}            # media id -> loading task
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.catalog_fills = 0
+
+    def clear(self):
+        self._entries.clear()
+
+    def put(self, media_id: int, media: Dict):
+        self._entries[media_id] = (time.monotonic() + self.ttl, media)
+        self._entries.move_to_end(media_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _lookup(self, media_id: int) -> Union[Dict, None]:
+        entry = self._entries.get(media_id)
+        if entry is None:
+            return None
+        expires_at, media = entry
+        if expires_at <= time.monotonic():
+            del self._entries[media_id]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(media_id)
+        return media
+
+    async def _load(self, media_id: int) -> Union[Dict, None]:
+        catalog = catalog_cache.catalog
+        media = catalog.details(media_id) if MEDIA_FROM_CATALOG and catalog is not None else None
+        if media is not None:
+            self.catalog_fills += 1
         else:
-            self.send_response(404)
-            self.end_headers()
-    
-    def log_message(self, format, *args):
-        # Suppress HTTP server logs
-        pass
+            media = await fetch_media_by_id(media_id)
+        if media is not None:
+            self.put(media_id, media)
+        return media
+
+    async def get(self, media_id: int) -> Union[Dict, None]:
+        media = self._lookup(media_id)
+        if media is not None:
+            self.hits += 1
+            return media
+        self.misses += 1
+
+        task = self._inflight.get(media_id)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._load(media_id))
+            self._inflight[media_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(media_id, None))
+        # Shield so one cancelled waiter does not cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "catalog_fills": self.catalog_fills,
+        }
+
+media_cache = MediaCache(MEDIA_CACHE_SIZE, MEDIA_CACHE_TTL)
 
 # Helper functions for media
-async def get_all_media() -> Union[List[Dict], None]:
-    try:
-        response = requests.get(f"{BASE_URL}{MEDIA_ENDPOINT}", timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        return None
-    except Exception as e:
-        logger.error(f"Error getting all media: {e}")
-        return None
+async def get_all_media() -> Union[Catalog, None]:
+    with span("catalog"):
+        return await catalog_cache.get()
 
-async def get_media_by_id(media_id: int) -> Union[Dict, None]:
+async def fetch_media_by_id(media_id: int) -> Union[Dict, None]:
     try:
-        response = requests.get(f"{BASE_URL}{MEDIA_ENDPOINT}/{media_id}", timeout=10)
-        if response.status_code == 200:
-            return response.json()
+        status, _, media = await media_api.get_json(f"{MEDIA_ENDPOINT}/{media_id}")
+        if status == 200:
+            return media
         return None
     except Exception as e:
         logger.error(f"Error getting media by ID: {e}")
         return None
 
+async def get_media_by_id(media_id: int) -> Union[Dict, None]:
+    return await media_cache.get(media_id)
+
 def create_media_message(media: Dict) -> str:
     message = f"🎬 {media.get('title', 'N/A')}\n\n"
     message += f"📅 Release Date: {media.get('release_date', 'N/A')}\n"
@@ -434,65 +3412,664 @@ def create_episode_buttons(season_data: Dict, media_id: int, season_num: str) ->
     buttons.append([InlineKeyboardButton("🔙 Back", callback_data=f"season_{season_num}_{media_id}")])
     return InlineKeyboardMarkup(buttons)
 
-def filter_media_by_query(all_media: List[Dict], query: str) -> List[Dict]:
-    """Enhanced search function"""
-    query = query.lower().strip()
-    if not query:
-        return all_media
-    
-    filtered = []
-    query_words = query.split()
-    
-    for media in all_media:
-        title = media.get('title', '').lower()
-        
-        # Exact match
-        if query in title:
-            filtered.append(media)
-            continue
-        
-        # Word-by-word match
-        title_words = title.split()
-        if all(any(query_word in title_word for title_word in title_words) for query_word in query_words):
-            filtered.append(media)
-            continue
-        
-        # Check if all query words are present
-        if all(word in title for word in query_words):
-            filtered.append(media)
-            continue
-        
-        # Partial match for single words
-        if len(query_words) == 1 and query in title:
-            filtered.append(media)
-            continue
-        
-        # Check keywords
-        if 'keywords' in media and media['keywords']:
-            if any(query in kw.lower() for kw in media['keywords']):
-                filtered.append(media)
+YEAR_PATTERN = re.compile(r"\b(19|20)\d{2}\b")
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance, or max_distance + 1 once it is exceeded"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before_previous, previous_row = previous_row, row
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before_previous[j - 2] + 1)
+        if min(row) > max_distance:
+            return max_distance + 1
+    return row[-1]
+
+class SearchIndex:
+    """Inverted index over a Catalog, built once per catalog version.
+
+    Matches exactly what the bot's original linear scan returned (kept as
+    filter_media_by_query() in benchmarks/bench_search.py): every query word must
+    be a substring of some title word, or the whole query must be a substring
+    of a keyword or alternative title. Substring lookups go through an n-gram
+    index over the distinct title words and keyword/alternative-title phrases,
+    so a query only touches the vocabulary entries and titles it matches.
+
+    ranked_search() layers scoring and a typo-tolerant fallback on top, using a
+    symmetric-delete index over the title vocabulary.
+    """
+
+    GRAM_SIZE = 3
+    MAX_EDIT_DISTANCE = 2
+
+    # Scoring model for ranked_search()
+    SCORE_EXACT = 100
+    SCORE_PREFIX = 80
+    SCORE_WORD = 60
+    SCORE_PARTIAL = 40
+    SCORE_PHRASE = 20
+    BOOST_YEAR = 15
+    BOOST_RATING = 1  # per rating point, ratings are out of 10
+
+    def __init__(self, catalog: Catalog):
+        self.catalog = catalog
+        self.titles = catalog.titles  # catalog position -> lowercased title
+        self.words = []        # word id -> title word
+        self.word_docs = []    # word id -> catalog positions
+        self.phrases = []      # phrase id -> keyword / alternative title
+        self.phrase_docs = []  # phrase id -> catalog positions
+        word_ids = {}
+        phrase_ids = {}
+
+        for position, title in enumerate(catalog.titles):
+            for word in set(title.split()):
+                self._add_posting(word, position, word_ids, self.words, self.word_docs)
+            for phrase in set(catalog.phrases[position]):
+                self._add_posting(phrase, position, phrase_ids, self.phrases, self.phrase_docs)
+
+        self.word_grams = self._build_grams(self.words)
+        self.phrase_grams = self._build_grams(self.phrases)
+
+        # Typo-tolerance vocabulary: whole title words plus their alphanumeric
+        # pieces, so "spidr" can still reach "spider-man:"
+        fuzzy_ids = {}
+        self.fuzzy_terms = []  # fuzzy term id -> word or word piece
+        self.fuzzy_words = []  # fuzzy term id -> word ids
+        for word_id, word in enumerate(self.words):
+            for term in {word, *re.findall(r"\w+", word)}:
+                self._add_posting(term, word_id, fuzzy_ids, self.fuzzy_terms, self.fuzzy_words)
+        self.fuzzy_deletes = self._build_deletes(self.fuzzy_terms)
+
+    @staticmethod
+    def _add_posting(term: str, position: int, ids: Dict, terms: List, docs: List):
+        term_id = ids.get(term)
+        if term_id is None:
+            term_id = ids[term] = len(terms)
+            terms.append(term)
+            docs.append([])
+        docs[term_id].append(position)
+
+    @classmethod
+    def _build_grams(cls, terms: List[str]) -> Dict[str, List[int]]:
+        """Map every substring of up to GRAM_SIZE characters to the terms containing it"""
+        grams = {}
+        for term_id, term in enumerate(terms):
+            seen = set()
+            for size in range(1, cls.GRAM_SIZE + 1):
+                for start in range(len(term) - size + 1):
+                    gram = term[start:start + size]
+                    if gram not in seen:
+                        seen.add(gram)
+                        grams.setdefault(gram, []).append(term_id)
+        return grams
+
+    @classmethod
+    def _max_distance(cls, word: str) -> int:
+        if len(word) < 4:
+            return 0
+        return 1 if len(word) < 7 else cls.MAX_EDIT_DISTANCE
+
+    @staticmethod
+    def _deletes(word: str, max_distance: int) -> set:
+        variants = {word}
+        frontier = {word}
+        for _ in range(max_distance):
+            frontier = {
+                variant[:i] + variant[i + 1:]
+                for variant in frontier
+                for i in range(len(variant))
+            }
+            variants |= frontier
+        return variants
+
+    @classmethod
+    def _build_deletes(cls, terms: List[str]) -> Dict[str, List[int]]:
+        """Symmetric-delete index: every term reachable by removing up to N characters"""
+        deletes = {}
+        for term_id, term in enumerate(terms):
+            if term.isdigit():
                 continue
-        
-        # Check alternative titles
-        if 'alternative_titles' in media and media['alternative_titles']:
-            for alt_title in media['alternative_titles']:
-                if query in alt_title.lower():
-                    filtered.append(media)
-                    break
-    
-    return filtered
+            for variant in cls._deletes(term, cls._max_distance(term)):
+                deletes.setdefault(variant, []).append(term_id)
+        return deletes
+
+    def _corrections(self, word: str) -> List[int]:
+        """Title words closest to a misspelled query word, within its edit budget"""
+        max_distance = self._max_distance(word)
+        if not max_distance:
+            return []
+        candidates = set()
+        for variant in self._deletes(word, max_distance):
+            candidates.update(self.fuzzy_deletes.get(variant, ()))
+        best_distance = max_distance + 1
+        best = []
+        for term_id in candidates:
+            distance = edit_distance(word, self.fuzzy_terms[term_id], best_distance)
+            if distance < best_distance:
+                best_distance = distance
+                best = [term_id]
+            elif distance == best_distance:
+                best.append(term_id)
+        if best_distance > max_distance:
+            return []
+        return [word_id for term_id in best for word_id in self.fuzzy_words[term_id]]
+
+    def _terms_containing(self, needle: str, grams: Dict, terms: List[str]) -> List[int]:
+        if len(needle) <= self.GRAM_SIZE:
+            return grams.get(needle, [])
+        postings = []
+        for start in range(len(needle) - self.GRAM_SIZE + 1):
+            posting = grams.get(needle[start:start + self.GRAM_SIZE])
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        return [term_id for term_id in candidates if needle in terms[term_id]]
+
+    def _docs_containing(self, needle: str, grams: Dict, terms: List[str], docs: List) -> set:
+        matched = set()
+        for term_id in self._terms_containing(needle, grams, terms):
+            matched.update(docs[term_id])
+        return matched
+
+    def _match(self, query: str) -> set:
+        matched = None
+        for word in set(query.split()):
+            docs = self._docs_containing(word, self.word_grams, self.words, self.word_docs)
+            matched = docs if matched is None else matched & docs
+            if not matched:
+                break
+        matched = matched or set()
+        matched |= self._docs_containing(query, self.phrase_grams, self.phrases, self.phrase_docs)
+        return matched
+
+    def _fuzzy_match(self, query: str) -> set:
+        matched = None
+        for word in set(query.split()):
+            docs = self._docs_containing(word, self.word_grams, self.words, self.word_docs)
+            if not docs:
+                for word_id in self._corrections(word):
+                    docs.update(self.word_docs[word_id])
+            matched = docs if matched is None else matched & docs
+            if not matched:
+                return set()
+        return matched or set()
+
+    def _score(self, position: int, query: str, query_words: List[str], years: set) -> float:
+        title = self.titles[position]
+        title_words = title.split()
+        if title == query:
+            score = self.SCORE_EXACT
+        elif title.startswith(query):
+            score = self.SCORE_PREFIX
+        elif query_words and all(word in title_words for word in query_words):
+            score = self.SCORE_WORD
+        elif query_words and all(any(word in title_word for title_word in title_words) for word in query_words):
+            score = self.SCORE_PARTIAL
+        else:
+            score = self.SCORE_PHRASE
+
+        if years and str(self.catalog.years[position]) in years:
+            score += self.BOOST_YEAR
+        return score + self.catalog.ratings[position] * self.BOOST_RATING
+
+    def search(self, query: str) -> array:
+        """Ids of the unranked matches in catalog order, identical to the linear scan"""
+        query = query.lower().strip()
+        if not query:
+            return array('q', self.catalog.ids)
+        ids = self.catalog.ids
+        return array('q', (ids[position] for position in sorted(self._match(query))))
+
+    def ranked_search(self, query: str) -> array:
+        """Ids of the best matches first, retrying without a release year and then with typo correction"""
+        query = query.lower().strip()
+        if not query:
+            return array('q', self.catalog.ids)
 
-async def auto_delete_message(client: Client, chat_id: int, message_id: int, delay: int = 600):
-    """Auto delete message after specified delay"""
-    await asyncio.sleep(delay)
+        years = {match.group(0) for match in YEAR_PATTERN.finditer(query)}
+        terms = query
+        matched = self._match(query)
+        if not matched and years:
+            without_years = " ".join(YEAR_PATTERN.sub(" ", query).split())
+            if without_years:
+                terms = without_years
+                matched = self._match(terms)
+        if not matched:
+            matched = self._fuzzy_match(terms)
+
+        query_words = [word for word in terms.split() if word not in years]
+        ranked = sorted(
+            matched,
+            key=lambda position: (-self._score(position, terms, query_words, years), position)
+        )
+        ids = self.catalog.ids
+        return array('q', (ids[position] for position in ranked))
+
+# Search worker pool
+_worker_catalog = None  # (catalog version, SearchIndex) inside a search worker process
+
+def _search_worker_init():
     try:
-        await client.delete_messages(chat_id, message_id)
-        logger.info(f"Auto-deleted message {message_id} from chat {chat_id}")
-    except Exception as e:
-        logger.error(f"Error deleting message: {e}")
+        os.nice(SEARCH_WORKER_NICE)
+    except (AttributeError, OSError) as e:
+        logger.debug(f"Could not lower search worker priority: {e}")
+
+def _search_worker_load(path: str, version: int) -> int:
+    """Runs in a search worker: parse the catalog snapshot and index it"""
+    global _worker_catalog
+    if _worker_catalog is None or _worker_catalog[0] != version:
+        with open(path, "rb") as f:
+            catalog = Catalog.from_media(json.load(f), details=False)
+        _worker_catalog = None  # Free the previous index before building the next one
+        _worker_catalog = (version, SearchIndex(catalog))
+    return len(_worker_catalog[1].catalog)
+
+def _search_worker_search(query: str) -> array:
+    """Runs in a search worker: ids of the ranked matches"""
+    return _worker_catalog[1].ranked_search(query)
+
+class SearchPool:
+    """Worker processes that each index the catalog snapshot and answer searches.
+
+    Only the snapshot path, the query and the resulting id list cross the
+    process boundary; the catalog itself is never pickled. Workers take a new
+    snapshot one at a time, so the others keep answering from the previous
+    catalog meanwhile. A worker that dies is restarted and reloaded.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executors = [None] * workers
+        self._loaded = [None] * workers    # Catalog version each worker holds
+        self._inflight = [0] * workers
+        self._loading = set()
+        self._snapshot = None              # (path, version) to load into restarted workers
+        self.searches = 0
+        self.fallbacks = 0
+        self.restarts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _executor(self, slot: int) -> ProcessPoolExecutor:
+        if self._executors[slot] is None:
+            # Spawned, not forked: the bot process has an event loop and threads running
+            self._executors[slot] = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=_search_worker_init
+            )
+        return self._executors[slot]
+
+    async def _run(self, slot: int, func, *args):
+        self._inflight[slot] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor(slot), func, *args)
+        except BrokenProcessPool:
+            # A worker that dies while indexing is not reloaded straight away, or a bad snapshot would loop
+            self._restart(slot, reload=func is not _search_worker_load)
+            raise
+        finally:
+            self._inflight[slot] -= 1
+
+    def _restart(self, slot: int, reload: bool):
+        executor, self._executors[slot] = self._executors[slot], None
+        if executor is None:
+            return
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._loaded[slot] = None
+        self.restarts += 1
+        logger.warning(f"Search worker {slot} died, restarting it")
+        if reload and self._snapshot:
+            asyncio.create_task(self._load_slot(slot, *self._snapshot))
+
+    async def _load_slot(self, slot: int, path: str, version: int):
+        self._loading.add(slot)
+        try:
+            titles = await self._run(slot, _search_worker_load, path, version)
+            self._loaded[slot] = version
+            logger.debug(f"Search worker {slot} indexed {titles} titles (version {version})")
+        except Exception as e:
+            logger.error(f"Search worker {slot} could not load catalog version {version}: {e}")
+        finally:
+            self._loading.discard(slot)
+
+    async def load(self, path: str, version: int):
+        """Have every worker index the snapshot at path, one worker after another"""
+        self._snapshot = (path, version)
+        for slot in range(self.workers):
+            await self._load_slot(slot, path, version)
+
+    async def search(self, query: str) -> Union[array, None]:
+        """Ranked result ids, or None when no worker can answer"""
+        ready = [slot for slot in range(self.workers) if self._loaded[slot] is not None]
+        if not ready:
+            self.fallbacks += 1
+            return None
+        # Skip workers busy indexing unless that is all there is
+        candidates = [slot for slot in ready if slot not in self._loading] or ready
+        slot = min(candidates, key=self._inflight.__getitem__)
+        try:
+            ids = await self._run(slot, _search_worker_search, query)
+        except Exception as e:
+            logger.error(f"Search worker {slot} failed: {e}")
+            self.fallbacks += 1
+            return None
+        self.searches += 1
+        return ids
+
+    def close(self):
+        for executor in self._executors:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = [None] * self.workers
+        self._loaded = [None] * self.workers
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "ready": sum(version is not None for version in self._loaded),
+            "searches": self.searches,
+            "fallbacks": self.fallbacks,
+            "restarts": self.restarts,
+        }
+
+search_pool = SearchPool(SEARCH_WORKERS)
+
+async def search_media(query: str) -> array:
+    """Search the cached catalog, returning media ids, best matches first"""
+    started = time.perf_counter()
+    try:
+        with span("search"):
+            if search_pool.enabled:
+                ids = await search_pool.search(query)
+                if ids is not None:
+                    return ids
+            index = await catalog_cache.local_index()
+            return index.ranked_search(query) if index is not None else array('q')
+    finally:
+        search_latency.observe(time.perf_counter() - started)
+
+# Search sessions
+class SearchSession:
+    """A user's last search: the query and the ids of its results, best first"""
+
+    __slots__ = ("query", "ids", "page", "expires_at", "size")
+
+    def __init__(self, query: str, ids: array, expires_at: float):
+        self.query = query
+        self.ids = ids
+        self.page = 0
+        self.expires_at = expires_at
+        self.size = SessionStore.SESSION_OVERHEAD + sys.getsizeof(query) + sys.getsizeof(ids)
+
+class SessionStore:
+    """LRU + TTL store of search sessions, capped by count and approximate bytes.
+
+    Sessions hold result ids only; the media for a page comes from the
+    catalog/media caches when it is shown. An evicted session is rebuilt by
+    re-running its query, which callers recover from the results message.
+    """
+
+    SESSION_OVERHEAD = 200  # Slots object, dict entry and key, roughly
+
+    def __init__(self, ttl: int, max_count: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()  # user id -> SearchSession, least recently used first
+        self.total_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rebuilds = 0
+        self.shared_hits = 0
+
+    async def put(self, user_id: int, query: str, ids) -> SearchSession:
+        """Store the session locally and, capped at SESSION_SHARED_IDS ids, in shared state"""
+        session = self._insert(user_id, query, array('q', ids))
+        if state_backend.shared:
+            shared = {"q": query, "ids": session.ids[:SESSION_SHARED_IDS].tolist()}
+            if len(session.ids) > SESSION_SHARED_IDS:
+                shared["total"] = len(session.ids)
+            try:
+                await state_backend.set(f"session:{user_id}", json.dumps(shared), ttl=self.ttl)
+            except Exception as e:
+                logger.error(f"Error sharing search session: {e}")
+        return session
+
+    def _insert(self, user_id: int, query: str, ids: array) -> SearchSession:
+        self._remove(user_id)
+        session = SearchSession(query, ids, time.monotonic() + self.ttl)
+        self._sessions[user_id] = session
+        self.total_bytes += session.size
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_count or self.total_bytes > self.max_bytes):
+            self._remove(next(iter(self._sessions)))
+            self.evictions += 1
+        return session
+
+    def get(self, user_id: int) -> Union[SearchSession, None]:
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if session.expires_at <= now:
+            self._remove(user_id)
+            self.expirations += 1
+            return None
+        session.expires_at = now + self.ttl
+        self._sessions.move_to_end(user_id)
+        return session
+
+    async def fetch(self, user_id: int) -> Union[SearchSession, None]:
+        """get(), falling back to a session stored by another worker.
+
+        A shared session that was cut to SESSION_SHARED_IDS is rebuilt by
+        re-running its query, so every page stays reachable.
+        """
+        session = self.get(user_id)
+        if session is not None or not state_backend.shared:
+            return session
+        try:
+            value = await state_backend.get(f"session:{user_id}")
+            if value is None:
+                return None
+            await state_backend.expire(f"session:{user_id}", self.ttl)
+        except Exception as e:
+            logger.error(f"Error reading shared search session: {e}")
+            return None
+        data = json.loads(value)
+        self.shared_hits += 1
+        if len(data["ids"]) < data.get("total", 0):
+            session = await self.rebuild(user_id, data["q"])
+            if session is not None:
+                return session
+        return self._insert(user_id, data["q"], array('q', data["ids"]))
+
+    def _remove(self, user_id: int):
+        session = self._sessions.pop(user_id, None)
+        if session is not None:
+            self.total_bytes -= session.size
+
+    async def rebuild(self, user_id: int, query: str) -> Union[SearchSession, None]:
+        """Re-run `query` after its session was evicted or replaced"""
+        await get_all_media()
+        results = await search_media(query)
+        if not results:
+            return None
+        self.rebuilds += 1
+        return await self.put(user_id, query, results)
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.total_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rebuilds": self.rebuilds,
+            "shared_hits": self.shared_hits,
+        }
+
+search_sessions = SessionStore(SESSION_TTL, SESSION_MAX_COUNT, SESSION_MAX_BYTES)
+
+SEARCH_FOOTER_PATTERN = re.compile(r"🔍 Search: '(.+)' \| 📄 Page: (\d+)/\d+")
+
+def parse_search_footer(message: Message) -> Union[tuple, None]:
+    """(query, page index) from the footer display_result_page puts on a results message"""
+    text = (message.text or message.caption or "") if message else ""
+    match = SEARCH_FOOTER_PATTERN.search(text)
+    if not match:
+        return None
+    return match.group(1), int(match.group(2)) - 1
+
+# Deferred message deletion
+class DeletionScheduler:
+    """Message deletions due at a later time, in one heap mirrored to SQLite.
+
+    A single task sleeps until the earliest deadline, then deletes everything
+    due (or due within DELETION_BATCH_WINDOW) with one delete_messages call
+    per chat and batch. Pending deletions are reloaded at startup, so anything
+    that fell due while the bot was down runs straight away.
+    """
+
+    BATCH_SIZE = 100  # Most message ids delete_messages accepts at once
+
+    def __init__(self, path: str, batch_window: int):
+        self.path = path
+        self.batch_window = batch_window
+        self._conn = None
+        self._write_lock = asyncio.Lock()  # One transaction at a time on the shared connection
+        self._heap = []  # (due timestamp, chat_id, message_id)
+        self._client = None
+        self._wake = None
+        self._task = None
+        self.deleted = 0
+        self.failed = 0
+
+    def load(self):
+        """Open the database and read pending deletions (runs once at startup)"""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_deletions ("
+            "chat_id INTEGER, message_id INTEGER, due_at REAL, PRIMARY KEY (chat_id, message_id))"
+        )
+        self._conn.commit()
+        self._heap = [
+            (due_at, chat_id, message_id)
+            for chat_id, message_id, due_at in self._conn.execute(
+                "SELECT chat_id, message_id, due_at FROM pending_deletions"
+            )
+        ]
+        heapq.heapify(self._heap)
+        overdue = sum(1 for due_at, _, _ in self._heap if due_at <= time.time())
+        logger.info(f"Loaded {len(self._heap)} pending deletions ({overdue} overdue)")
+
+    def _execute(self, sql: str, rows: List[tuple]):
+        if self._conn is None:
+            return
+        with self._conn:
+            self._conn.executemany(sql, rows)
+
+    async def _write(self, sql: str, rows: List[tuple]):
+        async with self._write_lock:
+            await asyncio.to_thread(self._execute, sql, rows)
+
+    async def schedule(self, chat_id: int, message_id: int, delay: float):
+        due_at = time.time() + delay
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (due_at, chat_id, message_id))
+        try:
+            await self._write(
+                "INSERT OR REPLACE INTO pending_deletions (chat_id, message_id, due_at) VALUES (?, ?, ?)",
+                [(chat_id, message_id, due_at)]
+            )
+        except Exception as e:
+            logger.error(f"Error saving scheduled deletion: {e}")
+        if self._wake is not None and (earliest is None or due_at < earliest):
+            self._wake.set()
+
+    async def _run_due(self):
+        horizon = time.time() + self.batch_window
+        by_chat = {}
+        while self._heap and self._heap[0][0] <= horizon:
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            by_chat.setdefault(chat_id, []).append(message_id)
+        finished = []
+        with background_calls():
+            for chat_id, message_ids in by_chat.items():
+                for start in range(0, len(message_ids), self.BATCH_SIZE):
+                    batch = message_ids[start:start + self.BATCH_SIZE]
+                    try:
+                        await self._client.delete_messages(chat_id, batch)
+                        self.deleted += len(batch)
+                    except FloodWait as e:
+                        # Try again once the wait is over (past the batching window, which would pull it forward)
+                        retry_at = time.time() + e.value + self.batch_window
+                        for message_id in batch:
+                            heapq.heappush(self._heap, (retry_at, chat_id, message_id))
+                        continue
+                    except Exception as e:
+                        logger.error(f"Error deleting {len(batch)} messages in chat {chat_id}: {e}")
+                        self.failed += len(batch)
+                    finished.extend((chat_id, message_id) for message_id in batch)
+        if finished:
+            logger.info(f"Auto-deleted {len(finished)} messages")
+            try:
+                await self._write(
+                    "DELETE FROM pending_deletions WHERE chat_id = ? AND message_id = ?", finished
+                )
+            except Exception as e:
+                logger.error(f"Error clearing finished deletions: {e}")
+
+    async def _loop(self):
+        while True:
+            try:
+                await self._run_due()
+            except Exception as e:
+                logger.error(f"Deletion scheduler error: {e}")
+            timeout = max(self._heap[0][0] - time.time(), 0) if self._heap else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, client: Client):
+        self._client = client
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict:
+        return {"pending": len(self._heap), "deleted": self.deleted, "failed": self.failed}
+
+deletion_scheduler = DeletionScheduler(DELETIONS_DB, DELETION_BATCH_WINDOW)
+
+async def auto_delete_message(client: Client, chat_id: int, message_id: int, delay: int = AUTO_DELETE_DELAY):
+    """Auto delete message after specified delay (survives restarts)"""
+    await deletion_scheduler.schedule(chat_id, message_id, delay)
 
 # Command handlers
 @app.on_message(filters.command("start"))
+@traced("start_command")
 async def start_command(client: Client, message: Message):
     user_id = message.from_user.id
     track_user(user_id, "search")
@@ -544,6 +4121,7 @@ async def start_command(client: Client, message: Message):
         await message.reply_text(welcome_message, reply_markup=keyboard)
 
 @app.on_message(filters.command("plan"))
+@traced("plan_command")
 async def plan_command(client: Client, message: Message):
     # Check membership
     is_member = await check_user_membership(client, message.from_user.id)
@@ -582,31 +4160,86 @@ async def plan_command(client: Client, message: Message):
     await message.reply_text(plan_message, reply_markup=keyboard)
 
 @app.on_message(filters.command("stats") & filters.user(ADMIN_ID))
+@traced("stats_command")
 async def stats_command(client: Client, message: Message):
-    total_users = len(user_stats)
-    today = datetime.now().date().isoformat()
-    
-    # Calculate today's activity
-    today_searches = 0
-    today_downloads = 0
-    for stats in user_stats.values():
-        last_seen = datetime.fromisoformat(stats["last_seen"]).date()
-        if last_seen.isoformat() == today:
-            today_searches += stats.get("search_count", 0)
-            today_downloads += stats.get("download_count", 0)
+    total_users = await shared_activity.total_users()
+    today = await shared_activity.day(datetime.now())
     
     stats_message = (
         f"**📊 BOT STATISTICS**\n\n"
         f"**👥 Total Users:** {total_users}\n"
-        f"**🔍 Today's Searches:** {today_searches}\n"
-        f"**📥 Today's Downloads:** {today_downloads}\n\n"
+        f"**🆕 New Today:** {today['new_users']}\n"
+        f"**🔥 Active Today:** {today['active_users']}\n"
+        f"**🔍 Today's Searches:** {today['searches']}\n"
+        f"**📥 Today's Downloads:** {today['downloads']}\n\n"
+        f"**📈 Last 7 Days (searches / downloads / active):**\n"
+    )
+    for day, counts in await shared_activity.history(7):
+        stats_message += f"`{day}` {counts['searches']} / {counts['downloads']} / {counts['active_users']}\n"
+    queue = download_scheduler.stats()
+    api = telegram_limiter.stats()
+    cached = video_cache.stats()
+    sessions = search_sessions.stats()
+    pool = search_pool.stats()
+    stats_message += (
+        f"\n**📥 Downloads:** {queue['active']} running, {queue['queue_depth']} queued "
+        f"(avg wait {queue['avg_wait']:.0f}s, max {queue['max_wait']:.0f}s)\n"
+        f"**📡 Telegram API:** {api['calls']} calls, {api['throttled']} throttled, "
+        f"{api['flood_waits']} flood waits, {api['retried']} retried\n"
+        f"**💽 Video Cache:** {cached['files']} files, {format_file_size(cached['bytes'])} "
+        f"({cached['hits']} hits, {cached['evictions']} evicted)\n"
+        f"**🗂 Search Sessions:** {sessions['sessions']} ({format_file_size(sessions['bytes'])}), "
+        f"{sessions['evictions']} evicted, {sessions['expirations']} expired, {sessions['rebuilds']} rebuilt\n"
+        f"**🔗 Shared State:** {STATE_BACKEND} (worker `{WORKER_ID}`)\n"
+        f"**🧮 Search Workers:** {pool['ready']}/{pool['workers']} ready, {pool['searches']} searches, "
+        f"{pool['fallbacks']} in-process, {pool['restarts']} restarts; "
+        f"last catalog rebuild {catalog_cache.rebuild_loop_lag * 1000:.0f} ms worst loop lag\n"
         f"**🚀 Server Status:** Online\n"
         f"**💾 Database:** Connected"
     )
     await message.reply_text(stats_message)
 
+@app.on_message(filters.command("profile") & filters.user(ADMIN_ID))
+async def profile_command(client: Client, message: Message):
+    """/profile on|off - sample the event loop's stacks between the two"""
+    action = message.command[1].lower() if len(message.command) > 1 else ("off" if profiler.running else "on")
+    if action == "on":
+        if profiler.running:
+            await message.reply_text("**🩺 Profiler is already running.** Send `/profile off` to stop it.")
+            return
+        profiler.start()
+        await message.reply_text(
+            f"**🩺 Profiler started** (every {PROFILE_INTERVAL * 1000:.0f} ms, stops itself after "
+            f"{PROFILE_MAX_SECONDS}s). Send `/profile off` for the report."
+        )
+        return
+    
+    if not profiler.stacks and not profiler.running:
+        await message.reply_text("**🩺 Profiler is not running.** Send `/profile on` to start it.")
+        return
+    profiler.stop()
+    duration = time.monotonic() - profiler.started_at
+    report = f"**🩺 Profile:** {profiler.samples} samples over {duration:.0f}s\n\n**🔥 Hottest functions:**\n"
+    for function, count in profiler.top_functions():
+        report += f"`{function}` {count * 100 / max(profiler.samples, 1):.1f}%\n"
+    await message.reply_text(report)
+    
+    # Collapsed stacks for flame graph tools
+    path = os.path.join(TEMP_DIR, f"profile_{int(time.time())}.txt")
+    try:
+        async with aiofiles.open(path, 'w') as f:
+            await f.write(profiler.collapsed())
+        await message.reply_document(path, caption="Collapsed stacks (flamegraph.pl / speedscope)")
+    except Exception as e:
+        logger.error(f"Error sending profile: {e}")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    profiler.stacks = {}
+
 # Auto-filter handler (text-based search)
-@app.on_message(filters.text & filters.private & ~filters.command(["start", "plan", "stats"]))
+@app.on_message(filters.text & filters.private & ~filters.command(["start", "plan", "stats", "profile"]))
+@traced("auto_filter")
 async def auto_filter(client: Client, message: Message):
     user_id = message.from_user.id
     
@@ -632,19 +4265,19 @@ async def auto_filter(client: Client, message: Message):
     # Add reaction
     try:
         await message.react("🔍")
-    except:
-        pass
+    except Exception as e:
+        logger.debug(f"Could not react to search message: {e}")
     
     # Show searching status
     search_msg = await message.reply_text(f"🔍 Searching for '{query}'...")
     
     # Get and filter media
-    all_media = await get_all_media()
-    if not all_media or not isinstance(all_media, list):
+    catalog = await get_all_media()
+    if not catalog:
         await search_msg.edit_text("**❌ Database connection failed. Please try again later.**")
         return
     
-    results = filter_media_by_query(all_media, query)
+    results = await search_media(query)
     if not results:
         await search_msg.edit_text(
             f"**❌ No results found for '{query}'**\n\n"
@@ -657,37 +4290,40 @@ async def auto_filter(client: Client, message: Message):
         return
     
     # Store results for pagination
-    user_data[user_id] = {
-        "results": results,
-        "current_page": 0,
-        "query": query
-    }
+    await search_sessions.put(user_id, query, results)
     
     # Delete searching message and display first result
     try:
         await search_msg.delete()
-    except:
-        pass
+    except Exception as e:
+        logger.debug(f"Could not delete searching message: {e}")
     
     # Display first result
     await display_result_page(client, user_id, None, 0, message.chat.id)
 
-async def display_result_page(client: Client, user_id: int, message_id: int, page: int, chat_id: int = None):
-    if user_id not in user_data:
-        return
+async def display_result_page(client: Client, user_id: int, message_id: int, page: int, chat_id: int = None,
+                              query: str = None) -> bool:
+    """Show one result of the user's search; `query` re-runs the search if the session is gone or differs"""
+    session = await search_sessions.fetch(user_id)
+    if query is not None and (session is None or session.query != query):
+        session = await search_sessions.rebuild(user_id, query)
+    if session is None:
+        return False
     
-    results = user_data[user_id]["results"]
-    total_pages = len(results)
-    query = user_data[user_id]["query"]
+    total_pages = len(session.ids)
+    query = session.query
     
     if page < 0 or page >= total_pages:
-        return
+        return False
     
-    user_data[user_id]["current_page"] = page
-    media = results[page]
+    session.page = page
+    media = await get_media_by_id(session.ids[page])
+    if media is None:
+        return False
     
     # Prepare message
-    message_text = create_media_message(media)
+    with span("render"):
+        message_text = create_media_message(media)
     message_text += f"\n\n**🔍 Search:** '{query}' | **📄 Page:** {page+1}/{total_pages}"
     
     # Prepare buttons
@@ -733,7 +4369,7 @@ async def display_result_page(client: Client, user_id: int, message_id: int, pag
                     photo=poster_url,
                     caption=message_text,
                     reply_markup=InlineKeyboardMarkup(buttons))
-            return
+            return True
     except Exception as e:
         logger.error(f"Error sending photo: {e}")
     
@@ -749,9 +4385,11 @@ async def display_result_page(client: Client, user_id: int, message_id: int, pag
             chat_id=chat_id or user_id,
             text=message_text,
             reply_markup=InlineKeyboardMarkup(buttons))
+    return True
 
 # Callback query handlers
 @app.on_callback_query()
+@traced("handle_callback_query")
 async def handle_callback_query(client: Client, callback_query: CallbackQuery):
     data = callback_query.data
     user_id = callback_query.from_user.id
@@ -776,7 +4414,7 @@ async def handle_callback_query(client: Client, callback_query: CallbackQuery):
     track_user(user_id, "search")
     
     if data == "check_membership":
-        is_member = await check_user_membership(client, user_id)
+        is_member = await check_user_membership(client, user_id, force_refresh=True)
         if is_member:
             await callback_query.answer("✅ Great! You're now a member. Enjoy the bot!", show_alert=True)
             # Redirect to main menu
@@ -807,7 +4445,13 @@ async def handle_callback_query(client: Client, callback_query: CallbackQuery):
     
     if data.startswith("result_page_"):
         page = int(data.split("_")[2])
-        await display_result_page(client, user_id, callback_query.message.id, page)
+        footer = parse_search_footer(callback_query.message)
+        shown = await display_result_page(
+            client, user_id, callback_query.message.id, page, query=footer[0] if footer else None
+        )
+        if not shown:
+            await callback_query.answer("⌛ This search has expired. Please search again.", show_alert=True)
+            return
         await callback_query.answer()
     
     elif data.startswith("select_"):
@@ -839,31 +4483,34 @@ async def handle_callback_query(client: Client, callback_query: CallbackQuery):
         # Send status message
         await callback_query.answer("🚀 Preparing your download...", show_alert=True)
         
-        # Send video file directly
-        sent = await send_video_file(
-            client,
-            callback_query.from_user.id,
-            video_url,
-            media,
-            quality
-        )
-        
-        if not sent:
-            # Fallback to download link
-            message_text = (
-                f"**🎬 {media.get('title', 'N/A')} - {quality.upper()}**\n\n"
-                f"**🎥 Quality:** {quality.upper()}\n\n"
-                "**⚠️ Direct file sending failed. Use the download button below.**\n\n"
-                "**Created By:** [Zero Creations](https://t.me/zerocreations)"
+        async def deliver():
+            # Send video file directly
+            sent = await send_video_file(
+                client,
+                callback_query.from_user.id,
+                video_url,
+                media,
+                quality
             )
-            buttons = InlineKeyboardMarkup([
-                [InlineKeyboardButton("🚀 DOWNLOAD NOW", url=process_video_url(video_url))],
-                [
-                    InlineKeyboardButton("⭐ RATE THIS MOVIE", callback_data=f"rate_{media_id}_{quality}"),
-                    InlineKeyboardButton("🔙 Back", callback_data=f"back_to_quality_{media_id}")
-                ]
-            ])
-            await callback_query.edit_message_text(message_text, reply_markup=buttons)
+            
+            if not sent:
+                # Fallback to download link
+                message_text = (
+                    f"**🎬 {media.get('title', 'N/A')} - {quality.upper()}**\n\n"
+                    f"**🎥 Quality:** {quality.upper()}\n\n"
+                    "**⚠️ Direct file sending failed. Use the download button below.**\n\n"
+                    "**Created By:** [Zero Creations](https://t.me/zerocreations)"
+                )
+                buttons = InlineKeyboardMarkup([
+                    [InlineKeyboardButton("🚀 DOWNLOAD NOW", url=process_video_url(video_url))],
+                    [
+                        InlineKeyboardButton("⭐ RATE THIS MOVIE", callback_data=f"rate_{media_id}_{quality}"),
+                        InlineKeyboardButton("🔙 Back", callback_data=f"back_to_quality_{media_id}")
+                    ]
+                ])
+                await callback_query.edit_message_text(message_text, reply_markup=buttons)
+        
+        await download_scheduler.submit(client, user_id, deliver, key=process_video_url(video_url))
     
     elif data.startswith("season_"):
         season_num = data.split("_")[1]
@@ -945,38 +4592,51 @@ async def handle_callback_query(client: Client, callback_query: CallbackQuery):
             "title": episode.get("title", f"Episode {episode_num}")
         }
         
-        sent = await send_video_file(
-            client,
-            callback_query.from_user.id,
-            video_url,
-            media,
-            quality,
-            episode_info
-        )
-        
-        if not sent:
-            # Fallback to download link
-            message_text = (
-                f"**📺 {media.get('title', 'N/A')} - S{season_num}E{episode_num}**\n\n"
-                f"**🎥 Quality:** {quality.upper()}\n"
-                f"**📝 Episode Title:** {episode.get('title', 'N/A')}\n\n"
-                "**⚠️ Direct file sending failed. Use the download button below.**\n\n"
-                "**Created By:** [Zero Creations](https://t.me/zerocreations)"
+        async def deliver():
+            sent = await send_video_file(
+                client,
+                callback_query.from_user.id,
+                video_url,
+                media,
+                quality,
+                episode_info
             )
-            buttons = InlineKeyboardMarkup([
-                [InlineKeyboardButton("🚀 DOWNLOAD NOW", url=process_video_url(video_url))],
-                [
-                    InlineKeyboardButton("⭐ RATE THIS EPISODE", callback_data=f"rate_{media_id}_{season_num}_{episode_num}"),
-                    InlineKeyboardButton("🔙 Back", callback_data=f"season_{season_num}_{media_id}")
-                ]
-            ])
-            await callback_query.edit_message_text(message_text, reply_markup=buttons)
+            
+            if not sent:
+                # Fallback to download link
+                message_text = (
+                    f"**📺 {media.get('title', 'N/A')} - S{season_num}E{episode_num}**\n\n"
+                    f"**🎥 Quality:** {quality.upper()}\n"
+                    f"**📝 Episode Title:** {episode.get('title', 'N/A')}\n\n"
+                    "**⚠️ Direct file sending failed. Use the download button below.**\n\n"
+                    "**Created By:** [Zero Creations](https://t.me/zerocreations)"
+                )
+                buttons = InlineKeyboardMarkup([
+                    [InlineKeyboardButton("🚀 DOWNLOAD NOW", url=process_video_url(video_url))],
+                    [
+                        InlineKeyboardButton("⭐ RATE THIS EPISODE", callback_data=f"rate_{media_id}_{season_num}_{episode_num}"),
+                        InlineKeyboardButton("🔙 Back", callback_data=f"season_{season_num}_{media_id}")
+                    ]
+                ])
+                await callback_query.edit_message_text(message_text, reply_markup=buttons)
+        
+        await download_scheduler.submit(client, user_id, deliver, key=process_video_url(video_url))
     
     elif data.startswith("back_to_"):
         if data == "back_to_search":
-            if user_id in user_data:
-                current_page = user_data[user_id]["current_page"]
-                await display_result_page(client, user_id, callback_query.message.id, current_page)
+            footer = parse_search_footer(callback_query.message)
+            session = await search_sessions.fetch(user_id)
+            if footer:
+                query, current_page = footer
+            elif session:
+                query, current_page = session.query, session.page
+            else:
+                query = None
+            if not query or not await display_result_page(
+                client, user_id, callback_query.message.id, current_page, query=query
+            ):
+                await callback_query.answer("⌛ This search has expired. Please search again.", show_alert=True)
+                return
         elif data.startswith("back_to_quality_"):
             media_id = int(data.split("_")[3])
             media = await get_media_by_id(media_id)
@@ -1030,32 +4690,22 @@ async def handle_callback_query(client: Client, callback_query: CallbackQuery):
                 "**⚠️ Important Notes:**\n"
                 "• Must join movie updates group\n"
                 "• Files are sent directly when possible\n"
-                "• All files auto-delete in 15 minutes\n"
+                f"• All files auto-delete in {AUTO_DELETE_DELAY // 60} minutes\n"
                 "• Save files to your device quickly\n"
                 "• Bot works in groups too!\n\n"
                 "**🎥 Movie Updates:** [Join Group](https://t.me/filmzi2)\n"
                 "**💎 Need Premium?** Contact: [Zero Creations](https://t.me/zerocreations)"
             )
         else:  # bot_stats
-            total_users = len(user_stats)
-            today = datetime.now().date().isoformat()
-            today_searches = 0
-            today_downloads = 0
-            active_today = 0
-            
-            for stats in user_stats.values():
-                last_seen = datetime.fromisoformat(stats["last_seen"]).date()
-                if last_seen.isoformat() == today:
-                    active_today += 1
-                    today_searches += stats.get("search_count", 0)
-                    today_downloads += stats.get("download_count", 0)
+            total_users = await shared_activity.total_users()
+            today = await shared_activity.day(datetime.now())
             
             text = (
                 f"**📊 FILMZI BOT STATISTICS**\n\n"
                 f"**👥 Total Users:** {total_users:,}\n"
-                f"**🔥 Active Today:** {active_today:,}\n"
-                f"**🔍 Today's Searches:** {today_searches:,}\n"
-                f"**📥 Today's Downloads:** {today_downloads:,}\n\n"
+                f"**🔥 Active Today:** {today['active_users']:,}\n"
+                f"**🔍 Today's Searches:** {today['searches']:,}\n"
+                f"**📥 Today's Downloads:** {today['downloads']:,}\n\n"
                 f"**🎬 Movie Updates:** [Join Group](https://t.me/filmzi2)\n"
                 f"**⚡ Status:** Online & Fast\n"
                 f"**🌐 Database:** Live & Updated\n"
@@ -1091,6 +4741,13 @@ async def handle_callback_query(client: Client, callback_query: CallbackQuery):
         ])
         await callback_query.edit_message_text(welcome_message, reply_markup=keyboard)
     
+    elif data.startswith("cancel_download_"):
+        job_id = int(data.split("_")[2])
+        if await download_scheduler.cancel(job_id, user_id):
+            await callback_query.answer("❌ Download cancelled")
+        else:
+            await callback_query.answer("Nothing to cancel", show_alert=True)
+    
     elif data.startswith("rate_"):
         await callback_query.answer("⭐ Thank you for your feedback!", show_alert=True)
     
@@ -1098,7 +4755,8 @@ async def handle_callback_query(client: Client, callback_query: CallbackQuery):
         await callback_query.answer()
 
 # Group message handler
-@app.on_message(filters.text & filters.group & ~filters.command(["start", "plan", "stats"]))
+@app.on_message(filters.text & filters.group & ~filters.command(["start", "plan", "stats", "profile"]))
+@traced("group_auto_filter")
 async def group_auto_filter(client: Client, message: Message):
     # Only respond if bot is mentioned or message is a reply to bot
     bot_mentioned = False
@@ -1135,12 +4793,12 @@ async def group_auto_filter(client: Client, message: Message):
         return
     
     # Get all media and filter locally
-    all_media = await get_all_media()
-    if not all_media or not isinstance(all_media, list):
+    catalog = await get_all_media()
+    if not catalog:
         await message.reply_text("**❌ Database connection failed. Please try again later.**")
         return
     
-    results = filter_media_by_query(all_media, query)
+    results = await search_media(query)
     if not results:
         await message.reply_text(
             f"**❌ No results found for '{query}'**\n\n"
@@ -1149,7 +4807,7 @@ async def group_auto_filter(client: Client, message: Message):
         return
     
     # For groups, show only first 5 results
-    limited_results = results[:5]
+    limited_results = [media for media in await asyncio.gather(*map(get_media_by_id, results[:5])) if media]
     message_text = f"**🔍 Search Results for '{query}':**\n\n"
     buttons = []
     
@@ -1174,8 +4832,16 @@ async def group_auto_filter(client: Client, message: Message):
         reply_markup=InlineKeyboardMarkup(buttons)
     )
 
+# Keep the membership cache in sync with the movie group (needs the bot to be a group admin)
+@app.on_chat_member_updated(filters.chat(MOVIE_GROUP_ID))
+async def handle_group_member_update(client: Client, update: ChatMemberUpdated):
+    member = update.new_chat_member or update.old_chat_member
+    if member and member.user:
+        await membership_cache.invalidate_shared(member.user.id)
+
 # Handle deep links from groups
 @app.on_message(filters.command("start") & filters.regex(r"movie_\d+"))
+@traced("handle_deep_link")
 async def handle_deep_link(client: Client, message: Message):
     user_id = message.from_user.id
     
@@ -1210,7 +4876,8 @@ async def handle_deep_link(client: Client, message: Message):
         return
     
     # Display media details
-    message_text = create_media_message(media)
+    with span("render"):
+        message_text = create_media_message(media)
     
     # Create buttons
     buttons = []
@@ -1239,17 +4906,40 @@ async def handle_deep_link(client: Client, message: Message):
     # Fallback to text
     await message.reply_text(message_text, reply_markup=InlineKeyboardMarkup(buttons))
 
+async def main():
+    loop_monitor.start()
+    health_runner = await start_health_server()
+    await app.start()
+    stats_store.start()
+    await catalog_cache.start()
+    video_cache.start()
+    deletion_scheduler.start(app)
+    await resume_interrupted_downloads(app)
+    logger.info("Enhanced Filmzi Bot is running with direct file sending capabilities...")
+    try:
+        await idle()
+    finally:
+        await catalog_cache.stop()
+        await media_api.close()
+        await stats_store.stop()
+        await state_backend.close()
+        search_pool.close()
+        await video_cache.stop()
+        await deletion_scheduler.stop()
+        file_id_cache.close()
+        await health_runner.cleanup()
+        loop_monitor.stop()
+        await app.stop()
+
 # Run the bot
 if __name__ == "__main__":
     logger.info("Starting Enhanced Filmzi Bot...")
     start_time = datetime.now()
     
-    # Load statistics
+    # Load statistics and cached uploads
     load_stats()
+    file_id_cache.load()
+    video_cache.load()
+    deletion_scheduler.load()
     
-    # Start health check server in a separate thread
-    health_thread = threading.Thread(target=start_health_server, daemon=True)
-    health_thread.start()
-    
-    logger.info("Enhanced Filmzi Bot is running with direct file sending capabilities...")
-    app.run()
+    app.run(main())